@@ -0,0 +1,673 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""A local stand-in for the SharePoint web services used by ADSMBase: the Lists,
+People, Webs and UserGroup endpoints under ``/_vti_bin``. Lists and users are kept in
+memory. Requests can be delayed, and a share of them answered with SOAP faults or
+throttled, so that syncs can be measured and their error handling exercised without
+touching the farm. Run it directly to serve lists of generated items, e.g.
+
+	python benchmarks/fakesharepoint.py --port 8080 --list {CI}=5000 --users 2000 --latency 0.05
+
+and point a script at it with ``SP_ADSM_URL=http://127.0.0.1:8080/_vti_bin``. No
+authentication is performed; credentials are accepted and ignored."""
+
+import argparse
+import BaseHTTPServer
+import collections
+import gzip
+import random
+import SocketServer
+import threading
+import time
+import urlparse
+import xml.etree.cElementTree as ET
+from cStringIO import StringIO
+from xml.sax.saxutils import escape, quoteattr
+
+
+SOAP_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+SP_NS = 'http://schemas.microsoft.com/sharepoint/soap/'
+DIRECTORY_NS = 'http://schemas.microsoft.com/sharepoint/soap/directory/'
+ROWSET_NS = 'xmlns:s="uuid:BDC6E3F0-6DA3-11d1-A2A3-00AA00C14882" xmlns:dt="uuid:C2F41010-65B3-11d1-A29F-00AA00C14882" xmlns:rs="urn:schemas-microsoft-com:rowset" xmlns:z="#RowsetSchema"'
+
+SUCCESS = '0x00000000'
+ITEM_MISSING = '0x81020016'
+INVALID_PARAMETER = '0x80070057'
+UNSPECIFIED = '0x80004005'
+
+# The operations of each service: (name, parameters, result type). Parameters are
+# (name, type) pairs, where 'any' is free-form XML such as CAML.
+SERVICES = {
+	'Lists': (SP_NS, (
+		('GetList', (('listName', 'string'),), 'any'),
+		('GetListItems', (('listName', 'string'), ('viewName', 'string'), ('query', 'any'), ('viewFields', 'any'), ('rowLimit', 'string'),
+		                  ('queryOptions', 'any'), ('webID', 'string')), 'any'),
+		('GetListItemChangesSinceToken', (('listName', 'string'), ('viewName', 'string'), ('query', 'any'), ('viewFields', 'any'), ('rowLimit', 'string'),
+		                                  ('queryOptions', 'any'), ('changeToken', 'string'), ('contains', 'any')), 'any'),
+		('UpdateList', (('listName', 'string'), ('listProperties', 'any'), ('newFields', 'any'), ('updateFields', 'any'), ('deleteFields', 'any'),
+		                ('listVersion', 'string')), 'any'),
+		('UpdateListItems', (('listName', 'string'), ('updates', 'any')), 'any'),
+	)),
+	'People': (SP_NS, (
+		('ResolvePrincipals', (('principalKeys', 'ArrayOfString'), ('principalType', 'string'), ('addToUserInfoList', 'boolean')), 'ArrayOfPrincipalInfo'),
+	)),
+	'UserGroup': (DIRECTORY_NS, (
+		('GetUserCollectionFromSite', (), 'any'),
+	)),
+	'Webs': (SP_NS, (
+		('GetColumns', (), 'any'),
+		('GetContentType', (('contentTypeId', 'string'),), 'any'),
+		('UpdateColumns', (('newFields', 'any'), ('updateFields', 'any'), ('deleteFields', 'any')), 'any'),
+		('UpdateContentType', (('contentTypeId', 'string'), ('contentTypeProperties', 'any'), ('newFields', 'any'), ('updateFields', 'any'),
+		                       ('deleteFields', 'any')), 'any'),
+	)),
+}
+
+WSDL_TYPES = '''
+<s:complexType name="ArrayOfString"><s:sequence><s:element minOccurs="0" maxOccurs="unbounded" name="string" nillable="true" type="s:string"/></s:sequence></s:complexType>
+<s:complexType name="ArrayOfPrincipalInfo"><s:sequence><s:element minOccurs="0" maxOccurs="unbounded" name="PrincipalInfo" type="tns:PrincipalInfo"/></s:sequence></s:complexType>
+<s:complexType name="PrincipalInfo"><s:sequence>
+	<s:element minOccurs="0" maxOccurs="1" name="AccountName" type="s:string"/>
+	<s:element minOccurs="1" maxOccurs="1" name="UserInfoID" type="s:int"/>
+	<s:element minOccurs="0" maxOccurs="1" name="DisplayName" type="s:string"/>
+	<s:element minOccurs="0" maxOccurs="1" name="Email" type="s:string"/>
+	<s:element minOccurs="0" maxOccurs="1" name="Department" type="s:string"/>
+	<s:element minOccurs="0" maxOccurs="1" name="Title" type="s:string"/>
+	<s:element minOccurs="1" maxOccurs="1" name="IsResolved" type="s:boolean"/>
+	<s:element minOccurs="0" maxOccurs="1" name="PrincipalType" type="s:string"/>
+</s:sequence></s:complexType>'''
+
+
+class Fault(Exception):
+	"""Raised by an operation to answer with a SOAP fault."""
+
+
+def local(tag):
+	return tag.rsplit('}', 1)[-1]
+
+
+def find(e, name):
+	"""Returns the first element named ``name``, in any namespace, within ``e``."""
+
+	if e is not None:
+		for x in e.iter():
+			if local(x.tag) == name:
+				return x
+	return None
+
+
+def findall(e, name):
+	return [x for x in e.iter() if local(x.tag) == name] if e is not None else []
+
+
+def attrs(pairs):
+	return u''.join(u' %s=%s' % (k, quoteattr(unicode(v))) for k, v in pairs if v is not None and v != u'')
+
+
+def element(name, text):
+	return u'<%s>%s</%s>' % (name, escape(unicode(text)), name) if text is not None else u''
+
+
+def wsdl(service, location):
+	"""Returns a WSDL describing the operations of ``service`` served at ``location``."""
+
+	ns, operations = SERVICES[service]
+	types, messages, ports, bindings = [], [], [], []
+
+	def param(name, kind):
+		if kind == 'any':
+			return '<s:element minOccurs="0" maxOccurs="1" name="%s"><s:complexType mixed="true"><s:sequence><s:any/></s:sequence></s:complexType></s:element>' % name
+		if kind == 'boolean':
+			return '<s:element minOccurs="1" maxOccurs="1" name="%s" type="s:boolean"/>' % name
+		return '<s:element minOccurs="0" maxOccurs="1" name="%s" type="%s:%s"/>' % (name, 's' if kind == 'string' else 'tns', kind)
+
+	for op, params, result in operations:
+		types.append('<s:element name="%s"><s:complexType><s:sequence>%s</s:sequence></s:complexType></s:element>' % (op, ''.join(param(*p) for p in params)))
+		types.append('<s:element name="%sResponse"><s:complexType><s:sequence>%s</s:sequence></s:complexType></s:element>' % (op, param(op + 'Result', result)))
+		messages.append('<wsdl:message name="%sSoapIn"><wsdl:part name="parameters" element="tns:%s"/></wsdl:message>' % (op, op))
+		messages.append('<wsdl:message name="%sSoapOut"><wsdl:part name="parameters" element="tns:%sResponse"/></wsdl:message>' % (op, op))
+		ports.append('<wsdl:operation name="%s"><wsdl:input message="tns:%sSoapIn"/><wsdl:output message="tns:%sSoapOut"/></wsdl:operation>' % (op, op, op))
+		bindings.append('<wsdl:operation name="%s"><soap:operation soapAction="%s%s" style="document"/>'
+		                '<wsdl:input><soap:body use="literal"/></wsdl:input><wsdl:output><soap:body use="literal"/></wsdl:output></wsdl:operation>' % (op, ns, op))
+
+	return '''<?xml version="1.0" encoding="utf-8"?>
+<wsdl:definitions xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/" xmlns:s="http://www.w3.org/2001/XMLSchema" xmlns:tns="%(ns)s" targetNamespace="%(ns)s" xmlns:wsdl="http://schemas.xmlsoap.org/wsdl/">
+<wsdl:types><s:schema elementFormDefault="qualified" targetNamespace="%(ns)s">%(types)s</s:schema></wsdl:types>
+%(messages)s
+<wsdl:portType name="%(service)sSoap">%(ports)s</wsdl:portType>
+<wsdl:binding name="%(service)sSoap" type="tns:%(service)sSoap"><soap:binding transport="http://schemas.xmlsoap.org/soap/http"/>%(bindings)s</wsdl:binding>
+<wsdl:service name="%(service)s"><wsdl:port name="%(service)sSoap" binding="tns:%(service)sSoap"><soap:address location="%(location)s"/></wsdl:port></wsdl:service>
+</wsdl:definitions>''' % {'ns': ns, 'service': service, 'location': escape(location), 'types': WSDL_TYPES + ''.join(types),
+                           'messages': '\n'.join(messages), 'ports': ''.join(ports), 'bindings': ''.join(bindings)}
+
+
+class FakeList(object):
+	"""The items of a list, in ID order. Items are dicts of internal field names to
+	unicode values, and are kept in a folder, None being the list's root folder. Every
+	change is numbered so that change tokens can be issued and honoured."""
+
+	def __init__(self, uuid, title=None):
+		self.uuid = uuid
+		self.title = title or uuid
+		self.items = collections.OrderedDict()
+		self.folders = {}
+		self.versions = {}
+		self.deleted = []
+		self.change = 0
+		self.next_id = 1
+
+	def add(self, fields, folder=None):
+		item_id = self.next_id
+		self.next_id += 1
+		self.items[item_id] = dict((k, unicode(v)) for k, v in fields.items() if v is not None)
+		self.items[item_id]['ID'] = unicode(item_id)
+		self.folders[item_id] = folder
+		self._changed(item_id)
+		return item_id
+
+	def update(self, item_id, fields):
+		item = self.items.get(item_id)
+		if item is None:
+			return False
+		item.update((k, unicode(v) if v is not None else u'') for k, v in fields.items() if k != 'ID')
+		self._changed(item_id)
+		return True
+
+	def delete(self, item_id):
+		if self.items.pop(item_id, None) is None:
+			return False
+		self.folders.pop(item_id)
+		self.versions.pop(item_id)
+		self.change += 1
+		self.deleted.append((self.change, item_id))
+		return True
+
+	def fields(self):
+		names = collections.OrderedDict()
+		for item in self.items.values():
+			names.update((k, None) for k in item)
+		return names.keys()
+
+	@property
+	def token(self):
+		return self.token_at(self.change)
+
+	def token_at(self, change):
+		return '1;3;%s;%d' % (self.uuid, change)
+
+	def since(self, token):
+		"""Returns the change number of a token issued by this list, or None if it was
+		not issued by this list."""
+
+		parts = (token or '').split(';')
+		if len(parts) != 4 or parts[2] != self.uuid or not parts[3].isdigit() or int(parts[3]) > self.change:
+			return None
+		return int(parts[3])
+
+	def _changed(self, item_id):
+		self.change += 1
+		self.versions[item_id] = self.change
+
+
+class FakeSharePoint(object):
+	"""The state and operations of the fake services. ``latency`` seconds, plus
+	``row_latency`` for each row read or written, are added to every response. Of
+	the requests for operations in ``error_ops``, all operations if None, a share of
+	``throttle_rate`` are refused with ``throttle_status`` and a share of
+	``error_rate`` answered with a SOAP fault. A share of ``method_error_rate`` of the
+	methods of ``UpdateListItems`` batches fail individually. ``stats`` counts the
+	requests made of each operation, faults, and the rows and bytes exchanged."""
+
+	def __init__(self, latency=0.0, row_latency=0.0, error_rate=0.0, throttle_rate=0.0, method_error_rate=0.0, error_ops=None,
+	             throttle_status=503, compress=True, seed=None):
+		self.latency = latency
+		self.row_latency = row_latency
+		self.error_rate = error_rate
+		self.throttle_rate = throttle_rate
+		self.method_error_rate = method_error_rate
+		self.error_ops = error_ops
+		self.throttle_status = throttle_status
+		self.compress = compress
+
+		self.random = random.Random(seed)
+		self.lock = threading.RLock()
+		self.server = None
+		self.url = None
+		self.reset()
+
+	def reset(self):
+		with self.lock:
+			self.lists = {}
+			self.users = []
+			self.principals = {}
+			self.columns = collections.OrderedDict()
+			self.content_types = {}
+			self.stats = collections.Counter()
+
+	# Seeding
+
+	def add_list(self, uuid, items=(), title=None, folder=None):
+		"""Creates a list holding ``items``, dicts of internal field names to values,
+		in ``folder`` and returns it."""
+
+		with self.lock:
+			lst = self.lists[uuid] = FakeList(uuid, title=title)
+			for item in items:
+				lst.add(item, folder=folder)
+			return lst
+
+	def add_user(self, login, name, email=None):
+		"""Adds a site user, resolvable by login or email, and returns its ID."""
+
+		with self.lock:
+			user = {'ID': len(self.users) + 1, 'LoginName': login, 'Name': name, 'Email': email or ''}
+			self.users.append(user)
+			for key in (login, email):
+				if key:
+					self.principals[key.lower()] = user
+			return user['ID']
+
+	# Serving
+
+	def start(self, host='127.0.0.1', port=0):
+		"""Serves the services on a background thread and returns their base URL."""
+
+		self.server = FakeSharePointServer((host, port), self)
+		thread = threading.Thread(target=self.server.serve_forever)
+		thread.daemon = True
+		thread.start()
+		self.url = 'http://%s:%d/_vti_bin' % self.server.server_address
+		return self.url
+
+	def stop(self):
+		if self.server:
+			self.server.shutdown()
+			self.server.server_close()
+			self.server = None
+
+	def handle(self, service, action, body):
+		"""Answers a SOAP request to ``service`` and returns its status, headers and
+		body."""
+
+		op = action.strip('"').rsplit('/', 1)[-1]
+		with self.lock:
+			self.stats['requests'] += 1
+			self.stats[op] += 1
+			self.stats['bytes_received'] += len(body)
+			roll = self.random.random()
+
+		rows = 0
+		try:
+			if op not in [o[0] for o in SERVICES[service][1]]:
+				raise Fault('Operation %s is not supported by %s.asmx' % (op, service))
+			if self.error_ops is None or op in self.error_ops:
+				if roll < self.throttle_rate:
+					self._count('throttled')
+					time.sleep(self.latency)
+					return self.throttle_status, [('Retry-After', '1')], 'Server Too Busy'
+				if roll < self.throttle_rate + self.error_rate:
+					raise Fault('Injected fault')
+
+			params = dict((local(e.tag), e) for e in self._operation(body))
+			with self.lock:
+				content, rows = getattr(self, 'op_' + op)(params)
+			status, payload = 200, self._envelope(op, SERVICES[service][0], content)
+		except Fault, e:
+			self._count('faults')
+			status, payload = 500, self._fault(unicode(e))
+
+		time.sleep(self.latency + self.row_latency * rows)
+		return status, [('Content-Type', 'text/xml; charset=utf-8')], payload.encode('utf-8')
+
+	def _count(self, name, n=1):
+		with self.lock:
+			self.stats[name] += n
+
+	def _operation(self, body):
+		try:
+			envelope = ET.fromstring(body)
+		except SyntaxError, e:
+			raise Fault('Invalid request: %s' % e)
+		body = envelope.find('{%s}Body' % SOAP_NS)
+		if body is None or len(body) == 0:
+			raise Fault('Invalid request: no operation')
+		return body[0]
+
+	def _envelope(self, op, ns, content):
+		return (u'<?xml version="1.0" encoding="utf-8"?><soap:Envelope xmlns:soap="%s" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+		        u'xmlns:xsd="http://www.w3.org/2001/XMLSchema"><soap:Body><%sResponse xmlns="%s"><%sResult>%s</%sResult></%sResponse></soap:Body>'
+		        u'</soap:Envelope>') % (SOAP_NS, op, ns, op, content, op, op)
+
+	def _fault(self, message):
+		return (u'<?xml version="1.0" encoding="utf-8"?><soap:Envelope xmlns:soap="%s"><soap:Body><soap:Fault><faultcode>soap:Server</faultcode>'
+		        u'<faultstring>Exception of type \'Microsoft.SharePoint.SoapServer.SoapServerException\' was thrown.</faultstring><detail>'
+		        u'<errorstring xmlns="%s">%s</errorstring></detail></soap:Fault></soap:Body></soap:Envelope>') % (SOAP_NS, SP_NS, escape(message))
+
+	# Lists.asmx
+
+	def _list(self, params):
+		name = params.get('listName')
+		lst = self.lists.get(name.text if name is not None else None)
+		if lst is None:
+			raise Fault('List does not exist. The page you selected contains a list that does not exist.')
+		return lst
+
+	def _row(self, lst, item_id, fields=None):
+		item = lst.items[item_id]
+		folder = lst.folders[item_id] or '/Lists/%s' % lst.title
+		# SharePoint always adds these to the fields asked for
+		system = [('_ModerationStatus', 0), ('_Level', 1), ('ID', item_id), ('UniqueId', '%d;#{%s-%012X}' % (item_id, lst.uuid.strip('{}')[:23], item_id)),
+		          ('owshiddenversion', lst.versions[item_id]), ('FSObjType', '%d;#0' % item_id), ('Created_x0020_Date', '%d;#2015-01-01 00:00:00' % item_id),
+		          ('FileLeafRef', '%d;#%d_.000' % (item_id, item_id)), ('PermMask', '0x7fffffffffffffff'),
+		          ('FileRef', '%d;#%s/%d_.000' % (item_id, folder.lstrip('/'), item_id)), ('MetaInfo', '%d;#' % item_id)]
+		values = [(name, item.get(name)) for name in (fields or item) if name != 'ID']
+		return u'<z:row%s/>' % attrs(('ows_' + k, v) for k, v in values + system)
+
+	def _matches(self, item, where):
+		op = local(where.tag)
+		if op in ('And', 'Or'):
+			results = [self._matches(item, x) for x in where]
+			return all(results) if op == 'And' else any(results)
+
+		ref = find(where, 'FieldRef')
+		value = item.get(ref.get('Name')) if ref is not None else None
+		expected = find(where, 'Value')
+		expected = (expected.text or u'') if expected is not None else u''
+		if op == 'IsNull':
+			return not value
+		if op == 'IsNotNull':
+			return bool(value)
+		if op == 'Eq':
+			return value == expected
+		if op == 'Neq':
+			return value != expected
+		if op == 'Contains':
+			return expected in (value or u'')
+		if op == 'BeginsWith':
+			return (value or u'').startswith(expected)
+		raise Fault('Unsupported CAML element %s' % op)
+
+	def _query(self, lst, params):
+		"""Returns the IDs of the items of ``lst`` selected by the query and folder of
+		a ``GetListItems`` request, and the fields to return."""
+
+		where = find(params.get('query'), 'Where')
+		where = where[0] if where is not None and len(where) else None
+		folder = find(params.get('queryOptions'), 'Folder')
+		folder = folder.text if folder is not None else None
+		fields = [ref.get('Name') for ref in findall(params.get('viewFields'), 'FieldRef')]
+
+		ids = [item_id for item_id, item in lst.items.iteritems()
+		       if lst.folders[item_id] == folder and (where is None or self._matches(item, where))]
+		return ids, fields
+
+	def op_GetList(self, params):
+		lst = self._list(params)
+		fields = u''.join(u'<Field%s/>' % attrs((('Name', f), ('StaticName', f), ('DisplayName', f), ('Type', 'Text'))) for f in lst.fields())
+		return u'<List%s><Fields>%s</Fields></List>' % (attrs((('ID', lst.uuid), ('Title', lst.title), ('ItemCount', len(lst.items)))), fields), 0
+
+	def op_GetListItems(self, params):
+		lst = self._list(params)
+		ids, fields = self._query(lst, params)
+
+		paging = find(params.get('queryOptions'), 'Paging')
+		position = paging.get('ListItemCollectionPositionNext') if paging is not None else None
+		if position:
+			last = int(urlparse.parse_qs(position).get('p_ID', ['0'])[0])
+			ids = [item_id for item_id in ids if item_id > last]
+
+		limit = params.get('rowLimit')
+		limit = int(limit.text) if limit is not None and limit.text else 100
+		page, more = ids[:limit], len(ids) > limit
+		position = 'Paged=TRUE&p_ID=%d' % page[-1] if more else None
+
+		rows = u''.join(self._row(lst, item_id, fields) for item_id in page)
+		self.stats['rows_returned'] += len(page)
+		return u'<listitems %s xmlns="%s"><rs:data%s>%s</rs:data></listitems>' % (
+			ROWSET_NS, SP_NS, attrs((('ItemCount', len(page)), ('ListItemCollectionPositionNext', position))), rows), len(page)
+
+	def op_GetListItemChangesSinceToken(self, params):
+		lst = self._list(params)
+		token = params.get('changeToken')
+		token = token.text if token is not None else None
+		ids, fields = self._query(lst, params)
+
+		limit = params.get('rowLimit')
+		limit = int(limit.text) if limit is not None and limit.text else None
+		last_token, more = lst.token, None
+
+		if token:
+			since = lst.since(token)
+			if since is None:
+				raise Fault('The change token is invalid for this list.')
+
+			# Return the changes in the order they were made, up to rowLimit of them, and
+			# a token at the last one returned when more remain
+			changed = sorted([(change, True, item_id) for change, item_id in lst.deleted if change > since] +
+			                 [(lst.versions[item_id], False, item_id) for item_id in ids if lst.versions[item_id] > since])
+			if limit is not None and len(changed) > limit:
+				changed = changed[:limit]
+				last_token, more = lst.token_at(changed[-1][0]), 'TRUE'
+			changes = u''.join(u'<Id ChangeType="Delete">%d</Id>' % item_id for change, deleted, item_id in changed if deleted)
+			ids = [item_id for change, deleted, item_id in changed if not deleted]
+		else:
+			changes = u''
+			ids = ids[:limit] if limit is not None else ids
+
+		rows = u''.join(self._row(lst, item_id, fields) for item_id in ids)
+		self.stats['rows_returned'] += len(ids)
+		return u'<listitems %s xmlns="%s"><Changes%s>%s</Changes><rs:data%s>%s</rs:data></listitems>' % (
+			ROWSET_NS, SP_NS, attrs((('LastChangeToken', last_token), ('MoreChanges', more))), changes, attrs((('ItemCount', len(ids)),)), rows), len(ids)
+
+	def op_UpdateListItems(self, params):
+		lst = self._list(params)
+		batch = find(params.get('updates'), 'Batch')
+		if batch is None:
+			raise Fault('Invalid request: no Batch')
+		folder = batch.get('RootFolder')
+
+		results = []
+		for method in findall(batch, 'Method'):
+			cmd = method.get('Cmd')
+			fields = dict((f.get('Name'), f.text or u'') for f in method if local(f.tag) == 'Field')
+			try:
+				item_id = int(fields.pop('ID', None))
+			except (TypeError, ValueError):
+				item_id = None
+
+			code, text = SUCCESS, None
+			if self.random.random() < self.method_error_rate:
+				code, text = UNSPECIFIED, 'Injected method failure'
+			elif cmd == 'New':
+				item_id = lst.add(fields, folder=folder)
+			elif cmd == 'Update':
+				if not lst.update(item_id, fields):
+					code, text = ITEM_MISSING, 'Item does not exist. It may have been deleted by another user.'
+			elif cmd == 'Delete':
+				if not lst.delete(item_id):
+					code, text = ITEM_MISSING, 'Item does not exist. It may have been deleted by another user.'
+			else:
+				code, text = INVALID_PARAMETER, 'Invalid command %s' % cmd
+
+			row = self._row(lst, item_id) if code == SUCCESS and cmd != 'Delete' else u''
+			results.append(u'<Result ID="%s,%s"><ErrorCode>%s</ErrorCode>%s%s</Result>' % (method.get('ID'), cmd, code, element('ErrorText', text), row))
+
+		self.stats['rows_written'] += len(results)
+		return u'<Results %s xmlns="%s">%s</Results>' % (ROWSET_NS, SP_NS, u''.join(results)), len(results)
+
+	def op_UpdateList(self, params):
+		lst = self._list(params)
+		return self._update_fields(params, lambda name: None), 0
+
+	def _update_fields(self, params, apply_f):
+		sections = []
+		for section in ('newFields', 'updateFields', 'deleteFields'):
+			results = []
+			for method in findall(params.get(section), 'Method'):
+				field = find(method, 'Field')
+				if field is not None and field.get('Name'):
+					apply_f(section, field)
+				results.append(u'<Method ID="%s"><ErrorCode>%s</ErrorCode></Method>' % (method.get('ID'), SUCCESS))
+			sections.append(u'<%s>%s</%s>' % (section[0].upper() + section[1:], u''.join(results), section[0].upper() + section[1:]))
+		return u'<Results>%s</Results>' % u''.join(sections)
+
+	# People.asmx
+
+	def op_ResolvePrincipals(self, params):
+		infos = []
+		for key in findall(params.get('principalKeys'), 'string'):
+			key = key.text or u''
+			user = self.principals.get(key.lower())
+			if user:
+				values = (('AccountName', user['LoginName']), ('UserInfoID', user['ID']), ('DisplayName', user['Name']), ('Email', user['Email']),
+				          ('IsResolved', 'true'), ('PrincipalType', 'User'))
+			else:
+				values = (('AccountName', key), ('UserInfoID', -1), ('DisplayName', key), ('IsResolved', 'false'), ('PrincipalType', 'None'))
+			infos.append(u'<PrincipalInfo>%s</PrincipalInfo>' % u''.join(element(k, v) for k, v in values))
+		return u''.join(infos), len(infos)
+
+	# UserGroup.asmx
+
+	def op_GetUserCollectionFromSite(self, params):
+		users = u''.join(u'<User%s/>' % attrs((('ID', u['ID']), ('Sid', 'S-1-5-21-%d' % u['ID']), ('Name', u['Name']), ('LoginName', u['LoginName']),
+		                                       ('Email', u['Email']), ('Notes', ''), ('IsSiteAdmin', 'False'), ('IsDomainGroup', 'False'))) for u in self.users)
+		return u'<GetUserCollectionFromSite xmlns="%s"><Users>%s</Users></GetUserCollectionFromSite>' % (DIRECTORY_NS, users), len(self.users)
+
+	# Webs.asmx
+
+	def _field(self, name, values):
+		return u'<Field%s/>' % attrs([('Name', name)] + sorted(values.items()))
+
+	def _column(self, name):
+		return self.columns.setdefault(name, {'ID': '{%08x-0000-0000-0000-000000000000}' % len(self.columns), 'StaticName': name, 'DisplayName': name,
+		                                      'Type': 'Text', 'Group': 'Custom Columns', 'SourceID': 'http://schemas.microsoft.com/sharepoint/v3'})
+
+	def op_GetColumns(self, params):
+		for lst in self.lists.values():
+			for name in lst.fields():
+				self._column(name)
+		return u'<Fields>%s</Fields>' % u''.join(self._field(name, values) for name, values in self.columns.items()), len(self.columns)
+
+	def op_UpdateColumns(self, params):
+		def apply_f(section, field):
+			if section == 'deleteFields':
+				self.columns.pop(field.get('Name'), None)
+			else:
+				self._column(field.get('Name')).update((k, v) for k, v in field.items() if k != 'Name')
+		return self._update_fields(params, apply_f), 0
+
+	def _content_type(self, params):
+		ctype_id = params.get('contentTypeId')
+		ctype_id = ctype_id.text if ctype_id is not None else None
+		if ctype_id not in self.content_types:
+			raise Fault('Content type %s cannot be found.' % ctype_id)
+		return ctype_id, self.content_types[ctype_id]
+
+	def op_GetContentType(self, params):
+		ctype_id, fields = self._content_type(params)
+		fields_xml = u''.join(self._field(name, self._column(name)) for name in fields)
+		return u'<ContentType%s><Fields>%s</Fields></ContentType>' % (attrs((('ID', ctype_id), ('Name', ctype_id))), fields_xml), 0
+
+	def op_UpdateContentType(self, params):
+		ctype_id, fields = self._content_type(params)
+
+		def apply_f(section, field):
+			if section == 'deleteFields':
+				fields.remove(field.get('Name'))
+			elif field.get('Name') not in fields:
+				fields.append(field.get('Name'))
+		return self._update_fields(params, apply_f), 0
+
+
+class FakeSharePointHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	# Send each response in one write, so small ones aren't held back by Nagle's algorithm
+	wbufsize = -1
+	disable_nagle_algorithm = True
+
+	def _service(self):
+		path = urlparse.urlsplit(self.path)
+		name = path.path.rstrip('/').rsplit('/', 1)[-1]
+		service = name[:-5] if name.lower().endswith('.asmx') else None
+		return path, service if service in SERVICES else None
+
+	def do_GET(self):
+		path, service = self._service()
+		if not service or path.query.lower() != 'wsdl':
+			return self._respond(404, [('Content-Type', 'text/plain')], 'Not found')
+		self.server.sharepoint._count('WSDL')
+		self._respond(200, [('Content-Type', 'text/xml; charset=utf-8')], wsdl(service, 'http://%s%s' % (self.headers.get('Host'), path.path)))
+
+	def do_POST(self):
+		body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+		path, service = self._service()
+		if not service:
+			return self._respond(404, [('Content-Type', 'text/plain')], 'Not found')
+		self._respond(*self.server.sharepoint.handle(service, self.headers.get('SOAPAction', ''), body))
+
+	def _respond(self, status, headers, body):
+		if self.server.sharepoint.compress and 'gzip' in (self.headers.get('Accept-Encoding') or '') and len(body) > 1024:
+			buf = StringIO()
+			with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=1) as f:
+				f.write(body)
+			body = buf.getvalue()
+			headers = headers + [('Content-Encoding', 'gzip')]
+
+		self.server.sharepoint._count('bytes_sent', len(body))
+		self.send_response(status)
+		for k, v in headers:
+			self.send_header(k, v)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+		self.wfile.flush()
+
+	def log_message(self, format, *args):
+		pass
+
+
+class FakeSharePointServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, address, sharepoint):
+		BaseHTTPServer.HTTPServer.__init__(self, address, FakeSharePointHandler)
+		self.sharepoint = sharepoint
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8080)
+	parser.add_argument('--list', help='UUID=COUNT, a list of COUNT generated items', action='append', default=[])
+	parser.add_argument('--users', type=int, default=100, help='number of generated site users')
+	parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+	parser.add_argument('--row-latency', type=float, default=0.0, help='seconds added for each row read or written')
+	parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with a SOAP fault')
+	parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of requests refused as throttled')
+	parser.add_argument('--throttle-status', type=int, default=503, help='HTTP status of throttled requests')
+	parser.add_argument('--method-error-rate', type=float, default=0.0, help='share of UpdateListItems methods that fail')
+	parser.add_argument('--error-ops', help='comma separated operations that faults and throttling apply to (default: all)')
+	parser.add_argument('--seed', type=int)
+	args = parser.parse_args()
+
+	sharepoint = FakeSharePoint(latency=args.latency, row_latency=args.row_latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+	                            method_error_rate=args.method_error_rate, error_ops=args.error_ops.split(',') if args.error_ops else None,
+	                            throttle_status=args.throttle_status, seed=args.seed)
+	for spec in args.list:
+		uuid, count = spec.rsplit('=', 1)
+		sharepoint.add_list(uuid, ({'Title': 'Item %d' % i, 'ContentType': 'Item'} for i in range(1, int(count) + 1)))
+	for i in range(1, args.users + 1):
+		sharepoint.add_user('UC\\user%d' % i, 'User %d' % i, 'user%d@example.com' % i)
+
+	print 'Serving %s' % sharepoint.start(args.host, args.port)
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		sharepoint.stop()
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Micro-benchmark of ADSMBase.fuzzy_match scoring against a table of synthetic
+titles. Compares the original nltk scan with the bounded scan in itsm.fuzzy and
+checks that they agree."""
+
+import argparse
+import random
+import time
+
+from nltk import metrics
+
+from itsm.fuzzy import best_match, ngrams
+
+
+WORDS = ('Administration', 'Alberta', 'Annex', 'Applied', 'Arts', 'Biological', 'Block', 'Building', 'Business',
+         'Campus', 'Centre', 'Chemistry', 'Clinical', 'Complex', 'Continuing', 'Cultural', 'Design', 'Development',
+         'Education', 'Engineering', 'Environmental', 'Faculty', 'Finance', 'Foothills', 'Graduate', 'Hall', 'Health',
+         'Heritage', 'Human', 'Information', 'Institute', 'International', 'Kinesiology', 'Laboratory', 'Language',
+         'Library', 'Management', 'Materials', 'Mathematical', 'Medical', 'Medicine', 'North', 'Nursing', 'Office',
+         'Physical', 'Planning', 'Research', 'Resources', 'Science', 'Services', 'Social', 'South', 'Station',
+         'Student', 'Studies', 'Support', 'Systems', 'Teaching', 'Technologies', 'Tower', 'Veterinary', 'Work')
+
+
+def titles(count, rng):
+	seen = set()
+	while len(seen) < count:
+		words = rng.sample(WORDS, rng.randint(2, 5))
+		if rng.random() < 0.3:
+			words.append(str(rng.randint(1, 999)))
+		seen.add(' '.join(words).lower())
+	return list(seen)
+
+
+def perturb(s, edits, rng):
+	s = list(s)
+	for _ in range(edits):
+		i = rng.randrange(len(s))
+		op = rng.choice('sid')
+		if op == 's':
+			s[i] = rng.choice('abcdefghijklmnopqrstuvwxyz ')
+		elif op == 'i':
+			s.insert(i, rng.choice('abcdefghijklmnopqrstuvwxyz '))
+		elif len(s) > 1:
+			del s[i]
+	return ''.join(s)
+
+
+def nltk_match(table, key, max_dist):
+	candidates = filter(lambda y: y[0] <= max_dist, ((metrics.edit_distance(x[0], key), x[1]) for x in table.items()))
+	candidates.sort(lambda x, y: x[0] - y[0])
+	return candidates[0][1] if len(candidates) > 0 else None
+
+
+def timed(f, queries):
+	start = time.time()
+	results = [f(q) for q in queries]
+	return results, (time.time() - start) / len(queries)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--titles', type=int, default=5000, help='number of titles in the table')
+	parser.add_argument('--queries', type=int, default=200, help='number of lookups')
+	parser.add_argument('--baseline-queries', type=int, default=20, help='number of lookups timed with nltk')
+	parser.add_argument('--max-dist', type=int, default=4)
+	parser.add_argument('--seed', type=int, default=1)
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+	table = dict((t, t) for t in titles(args.titles, rng))
+	keys = table.keys()
+	queries = [perturb(rng.choice(keys), rng.randint(0, args.max_dist + 2), rng) for _ in range(args.queries)]
+
+	candidates = [(k, v, ngrams(k)) for k, v in table.iteritems()]
+	match = lambda m: m[1] if m else None
+
+	baseline, baseline_t = timed(lambda q: nltk_match(table, q, args.max_dist), queries[:args.baseline_queries])
+	scan, scan_t = timed(lambda q: match(best_match(candidates, q, args.max_dist)), queries)
+
+	assert baseline == scan[:len(baseline)], 'matchers disagree'
+
+	print '%d titles, %d lookups, max_dist %d, %d matched' % (len(table), len(queries), args.max_dist, len(filter(None, scan)))
+	print '%-22s %10s %10s' % ('', 'ms/lookup', 'speedup')
+	print '%-22s %10.3f %10s' % ('nltk scan', baseline_t * 1000, '1.0x')
+	print '%-22s %10.3f %9.1fx' % ('bounded scan', scan_t * 1000, baseline_t / scan_t)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Measures how long each itsm entry point takes to import, in a fresh interpreter
+per run, and which heavy dependencies the import pulls in. On interpreters that
+support ``-X importtime`` the slowest modules of each import are listed too. With
+--budget, exits with an error if any entry point takes longer, so that startup
+regressions can be caught."""
+
+import argparse
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that no script should load before it needs them
+HEAVY = ('nltk', 'xlrd', 'rules', 'pymssql', 'couchdb', 'bs4', 'daemon')
+
+LOADER = '''
+import imp, json, sys, time
+start = time.time()
+try:
+	imp.load_source('entry_point', %(path)r) if %(path)r.endswith('.py') else __import__(%(path)r)
+	error = None
+except ImportError, e:
+	error = str(e)
+elapsed = time.time() - start
+sys.stdout.write(json.dumps({'seconds': elapsed, 'error': error, 'heavy': sorted(m for m in %(heavy)r if m in sys.modules)}))
+'''
+
+
+def entry_points():
+	points = ['itsm.adsm']
+	for path in sorted(glob.glob(os.path.join(ROOT, 'itsm', '*.py'))):
+		with open(path) as f:
+			if re.search(r'^def main\(', f.read(), re.M):
+				points.append(path)
+	return points
+
+
+def name(point):
+	return os.path.basename(point) if point.endswith('.py') else point
+
+
+def supports_importtime(python):
+	p = subprocess.Popen([python, '-X', 'importtime', '-c', 'pass'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	out, err = p.communicate()
+	return p.returncode == 0 and 'import time:' in err
+
+
+def run(python, point, importtime=False):
+	env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get('PYTHONPATH')))))
+	args = [python] + (['-X', 'importtime'] if importtime else []) + ['-c', LOADER % {'path': point, 'heavy': HEAVY}]
+	p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, cwd=ROOT)
+	out, err = p.communicate()
+	result = json.loads(out)
+
+	# Lines look like "import time:  self [us] | cumulative | imported package"
+	slowest = []
+	for line in err.splitlines():
+		m = re.match(r'import time:\s*(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)', line)
+		if m and len(m.group(3)) <= 1:
+			slowest.append((int(m.group(2)), m.group(4)))
+	result['slowest'] = sorted(slowest, reverse=True)[:5]
+
+	return result
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--python', default=sys.executable, help='interpreter to measure')
+	parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per entry point')
+	parser.add_argument('--budget', type=float, help='fail if an entry point takes longer than this many ms to import')
+	args = parser.parse_args()
+
+	importtime = supports_importtime(args.python)
+	over = []
+
+	print '%-32s %10s  %s' % ('entry point', 'ms', 'heavy modules loaded')
+	for point in entry_points():
+		results = [run(args.python, point) for _ in range(args.runs)]
+		ms = sorted(r['seconds'] for r in results)[len(results) / 2] * 1000
+
+		if results[0]['error']:
+			print '%-32s %10s  (%s)' % (name(point), '-', results[0]['error'])
+			continue
+
+		print '%-32s %10.1f  %s' % (name(point), ms, ', '.join(results[0]['heavy']) or '-')
+		if importtime:
+			for us, module in run(args.python, point, importtime=True)['slowest']:
+				print '%-32s %10.1f    %s' % ('', us / 1000.0, module)
+		if args.budget and ms > args.budget:
+			over.append(name(point))
+
+	if not importtime:
+		print '(-X importtime is not supported by %s; only total import times are shown)' % args.python
+	if over:
+		sys.exit('Over the %.0f ms budget: %s' % (args.budget, ', '.join(over)))
+
+
+if __name__ == '__main__':
+	main()
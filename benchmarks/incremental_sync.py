@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""Compares the keyed list tables built by --incremental runs against those of full
+fetches from the local SharePoint stand-in in fakesharepoint.py. A list is seeded,
+read once to take its snapshot, then changed: items are added, edited, deleted and
+re-typed out of a ContentType filter. Both the whole list and the filtered list are
+then read again with and without --incremental. The rows returned by each are
+reported, and the script exits non-zero if any table differs from its full fetch."""
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from fakesharepoint import FakeSharePoint
+
+from itsm.adsm import ADSMBase
+from suds.sax.parser import Parser
+
+
+ENV = 'SP_BENCH'
+LIST = '{6D1C0F52-3C4B-4C35-9A0E-5A4C1D2E0010}'
+FIELDS = ('ID', 'Title', 'ContentType')
+QUERY = '<ns1:query><Query><Where><Eq><FieldRef Name="ContentType"/><Value Type="Text">Building</Value></Eq></Where></Query></ns1:query>'
+
+
+def seed(sharepoint, count, rng):
+	items = [{'Title': 'Item %d' % i, 'ContentType': rng.choice(('Building', 'Site'))} for i in range(count)]
+	return sharepoint.add_list(LIST, items)
+
+
+def change(lst, count, rng):
+	"""Adds, edits and deletes ``count`` items each, and re-types ``count`` buildings
+	as sites, returning the IDs re-typed."""
+
+	for i in range(count):
+		lst.add({'Title': 'New item %d' % i, 'ContentType': 'Building'})
+	for item_id in rng.sample(lst.items.keys(), count):
+		lst.update(item_id, {'Title': lst.items[item_id]['Title'] + ' (edited)'})
+	for item_id in rng.sample(lst.items.keys(), count):
+		lst.delete(item_id)
+
+	buildings = [item_id for item_id, item in lst.items.items() if item['ContentType'] == 'Building']
+	retyped = rng.sample(buildings, min(count, len(buildings)))
+	for item_id in retyped:
+		lst.update(item_id, {'ContentType': 'Site'})
+	return retyped
+
+
+def table(sharepoint, cache, query, incremental):
+	args = [ENV, '--cache', cache] + (['--incremental'] if incremental else [])
+	adsm = ADSMBase(args)
+	adsm._prep_args()
+
+	before = sharepoint.stats['rows_returned']
+	query = Parser().parse(string=query).getChild('query') if query else None
+	rows = adsm.keyed_listitems(LIST, query=query, fields=FIELDS, key_field='_ows_ID')
+	adsm.persistent_cache.close()
+	for transport in adsm._transports.values():
+		transport.pool.close()
+	return dict((k, dict(v)) for k, v in rows.items()), sharepoint.stats['rows_returned'] - before
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--items', type=int, default=2000, help='items in the list (default: %(default)s)')
+	parser.add_argument('--changes', type=int, default=50, help='items added, edited, deleted and re-typed (default: %(default)s)')
+	parser.add_argument('--seed', type=int, default=1)
+	args = parser.parse_args()
+
+	logging.getLogger('suds').addHandler(logging.NullHandler())
+	rng = random.Random(args.seed)
+	sharepoint = FakeSharePoint(seed=args.seed)
+	os.environ.update({ENV + '_URL': sharepoint.start(), 'WSDL_CACHE': ''})
+	os.environ.pop(ENV + '_CACHE', None)
+
+	directory = tempfile.mkdtemp()
+	cache = os.path.join(directory, 'cache.sqlite')
+	failed = False
+	try:
+		lst = seed(sharepoint, args.items, rng)
+		for query in (None, QUERY):
+			table(sharepoint, cache, query, True)
+		retyped = change(lst, args.changes, rng)
+
+		print '%-10s %12s %12s %8s' % ('list', 'full rows', 'incr. rows', 'match')
+		for name, query in (('all', None), ('buildings', QUERY)):
+			full, full_rows = table(sharepoint, cache, query, False)
+			incremental, incremental_rows = table(sharepoint, cache, query, True)
+			stale = [item_id for item_id in retyped if query and unicode(item_id) in incremental]
+			match = incremental == full and not stale
+			failed = failed or not match
+			print '%-10s %12d %12d %8s' % (name, full_rows, incremental_rows, 'yes' if match else 'NO')
+			if stale:
+				print '%-10s %d re-typed items still in the table' % ('', len(stale))
+	finally:
+		sharepoint.stop()
+		shutil.rmtree(directory)
+
+	return 1 if failed else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
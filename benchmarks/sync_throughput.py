@@ -0,0 +1,466 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+"""End to end throughput of the sync tools against the local SharePoint stand-in in
+fakesharepoint.py. Each workload runs in a fresh interpreter, against lists seeded
+with synthetic data, through the same ADSMBase calls as the script it is modelled on:
+
+	opc        servers synced to the CI list as by opc-to-adsm, owners and admins
+	           resolved with person_ref, buildings, sites and states fuzzy matched
+	units      units synced to the UC list as by units-to-adsm
+	locations  sites and buildings diffed against the UC list as by locations-to-adsm
+	people     principals resolved one at a time with person_ref, misspelled names
+	           fuzzy matched against the site's users
+
+Items per second, SOAP round trips by operation and peak resident memory are
+reported for each workload, and written as JSON with --json to compare runs. Other
+options, such as --jobs, --stream or --batch-size, are passed on to ADSMBase."""
+
+import argparse
+import collections
+import datetime
+import json
+import logging
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import time
+import zlib
+
+from fakesharepoint import FakeSharePoint, SERVICES
+from fuzzy_match import WORDS, perturb
+
+from itsm.adsm import ADSMBase
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV = 'SP_BENCH'
+CI_LIST = '{6D1C0F52-3C4B-4C35-9A0E-5A4C1D2E0001}'
+UC_LIST = '{8E3E8107-9FEF-406F-880E-8C980E7400EE}'
+CHOICES_LIST = '{6D1C0F52-3C4B-4C35-9A0E-5A4C1D2E0003}'
+CI_FOLDER = '/sites/ADSM/Lists/CI/Assets'
+
+# The source rows of each workload, generated before it is timed
+WORKLOADS = collections.OrderedDict((('opc', ('servers',)), ('units', ('units',)), ('locations', ('sites', 'buildings')), ('people', ('principals',))))
+OPERATIONS = [op for ns, ops in SERVICES.values() for op, params, result in ops]
+
+FIRST = ('Alex', 'Amy', 'Ben', 'Carla', 'Chen', 'Dana', 'David', 'Elena', 'Farid', 'Grace', 'Hana', 'Ian', 'Jamal', 'Jane', 'John', 'Karen',
+         'Kevin', 'Laura', 'Li', 'Maria', 'Mark', 'Nadia', 'Omar', 'Paul', 'Priya', 'Raj', 'Rosa', 'Sam', 'Sara', 'Tom', 'Wei', 'Yusuf')
+LAST = ('Anderson', 'Brown', 'Campbell', 'Chan', 'Clark', 'Davies', 'Dubois', 'Evans', 'Fraser', 'Garcia', 'Gill', 'Harris', 'Ito', 'Johnson',
+        'Khan', 'Lee', 'MacDonald', 'Martin', 'Nguyen', 'Patel', 'Roy', 'Singh', 'Smith', 'Taylor', 'Thompson', 'Tremblay', 'Wang', 'Wilson')
+
+# Sites the opc workload refers to by their OPC names
+SITES = ('Main Campus', 'Foothills Campus', 'Spyhill Campus', 'University of Alberta')
+OPC_SITES = ('Main Campus', 'South Campus', 'Spy Hill', 'UofA')
+OPC_STATUSES = ('Development', 'Pre-Production', 'Production', 'Production Standby', 'Testing')
+LIFECYCLE_STATES = ('Plan', 'Develop', 'Test', 'Deploy', 'Sustain', 'Retire')
+
+
+def peak_rss():
+	"""Returns the peak resident memory of this process, in MB."""
+
+	# On Linux ru_maxrss survives exec, so a worker would report the peak of the
+	# process that started it. VmHWM starts again with the new program.
+	try:
+		with open('/proc/self/status') as f:
+			for line in f:
+				if line.startswith('VmHWM:'):
+					return int(line.split()[1]) / 1024.0
+	except IOError:
+		pass
+
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return rss / (1048576.0 if sys.platform == 'darwin' else 1024.0)
+
+
+class Dataset(object):
+	"""Synthetic source rows and list items. Every process given the same arguments
+	generates the same data."""
+
+	def __init__(self, args):
+		self.args = args
+		self._memo = {}
+
+	def _random(self, name):
+		return random.Random(self.args.seed ^ zlib.crc32(name))
+
+	def _memoized(self, name, f):
+		if name not in self._memo:
+			self._memo[name] = f(self._random(name))
+		return self._memo[name]
+
+	def users(self):
+		def generate(rng):
+			users, names = [], set()
+			while len(users) < self.args.users:
+				first, last, initial = rng.choice(FIRST), rng.choice(LAST), rng.choice('ABCDEFGHJKLMNPRSTW')
+				if (first, initial, last) in names:
+					continue
+				names.add((first, initial, last))
+				account = '%s%s%s%d' % (first[0], initial, last, len(users))
+				users.append({'login': 'UC\\' + account.lower(), 'name': '%s %s. %s' % (first, initial, last),
+				              'email': '%s.%s.%s@ucalgary.ca' % (first.lower(), initial.lower(), last.lower())})
+				# Some people also have an administrative account
+				if rng.random() < 0.03:
+					users.append({'login': 'UC_ADMIN\\' + account.lower(), 'name': '%s %s. %s (Admin)' % (first, initial, last),
+					              'email': '%s.%s.%s.admin@ucalgary.ca' % (first.lower(), initial.lower(), last.lower())})
+			return users
+		return self._memoized('users', generate)
+
+	def email(self, rng):
+		"""Returns the email of a random user, or one that doesn't resolve."""
+
+		if rng.random() < 0.05:
+			return 'former.staff%d@ucalgary.ca' % rng.randint(1, 500)
+		return rng.choice(self.users())['email']
+
+	def sites(self):
+		def generate(rng):
+			names = list(SITES)
+			while len(names) < self.args.sites:
+				name = '%s Campus' % rng.choice(WORDS)
+				if name not in names:
+					names.append(name)
+			return [{'Site Name': name, 'Site Code': 'S%02d' % i, 'Map URL': 'http://maps.ucalgary.ca/site/%d' % i} for i, name in enumerate(names)]
+		return self._memoized('sites', generate)
+
+	def buildings(self):
+		def generate(rng):
+			buildings, names, codes = [], set(), set()
+			while len(buildings) < self.args.buildings:
+				name = ' '.join(rng.sample(WORDS, rng.randint(2, 4)))
+				code = ''.join(w[0] for w in name.split()) + rng.choice('ABCDEFGHKLMNPRSTW')
+				if name in names or code in codes:
+					continue
+				names.add(name)
+				codes.add(code)
+				town = 'Priddis' if rng.random() < 0.02 else 'Calgary'
+				buildings.append({'Building Name': name, 'Abbreviation': code, 'Site Code': rng.choice(self.sites())['Site Code'],
+				                  'Number': str(100 + len(buildings)), 'Municipal Address': '%d %s Drive NW, %s' % (rng.randint(1, 4000), rng.choice(WORDS), town)})
+			return buildings
+		return self._memoized('buildings', generate)
+
+	def servers(self):
+		def generate(rng):
+			contact = lambda: '%s <%s>' % (rng.choice(FIRST), self.email(rng)) if rng.random() < 0.9 else None
+			date = lambda: datetime.datetime(2010, 1, 1) + datetime.timedelta(seconds=rng.randint(0, 5 * 365 * 86400))
+			servers = []
+			for i in range(self.args.servers):
+				building = rng.choice(self.buildings())['Building Name']
+				servers.append({
+					'ServerId': str(10000 + i), 'ServerName': 'srv%05d' % i, 'Tier3': 'Server' if rng.random() < 0.4 else 'Virtual Host',
+					'Function1': ' '.join(rng.sample(WORDS, 2)), 'Function2': rng.choice(WORDS) if rng.random() < 0.5 else None,
+					'OwnerContact': contact(), 'BusinessOwner': contact(), 'SystemAdmin1': contact(), 'SystemAdmin2': contact(), 'SystemAdmin3': contact(),
+					'InstallDate': date(), 'ModifiedDate': date(), 'Status': rng.choice(OPC_STATUSES),
+					'HostName': 'srv%05d.ucalgary.ca' % i, 'Make': rng.choice(('Dell', 'HP', 'IBM', 'Cisco', 'VMware')), 'Model': 'M%d' % rng.randint(100, 999),
+					'SiteGroup': rng.choice(OPC_SITES), 'Site': perturb(building, rng.randint(1, 3), rng) if rng.random() < 0.15 else building,
+					'ZoneLocation': 'DC%d-R%02d-U%02d' % (rng.randint(1, 3), rng.randint(1, 40), rng.randint(1, 42)), 'UCTagNum': 'UC%06d' % i
+				})
+			return servers
+		return self._memoized('servers', generate)
+
+	def units(self):
+		def generate(rng):
+			units = []
+			for i in range(self.args.units):
+				units.append({
+					'Id': str(50000 + i), 'Name': '%s %s' % (' '.join(rng.sample(WORDS, 2)), rng.choice(('Department', 'Office', 'Faculty', 'Centre'))),
+					'EntityVersion': rng.randint(1, 20), 'Code': 'U%04d' % i, 'Type': rng.choice(('Academic', 'Administrative', 'Research')),
+					'Website': 'http://ucalgary.ca/unit%d' % i, 'Keywords': ' '.join(rng.sample(WORDS, 3)),
+					'Rooms': {'ContactRoom': [{'Room': {'BuildingCode': rng.choice(self.buildings())['Abbreviation'].lower(), 'Number': str(rng.randint(100, 999))}}]},
+					'Phones': {'ContactPhone': [{'Phone': {'CountryCode': '1', 'AreaCode': '403', 'Number': '220-%04d' % rng.randint(0, 9999)}}]},
+					'Emails': {'ContactEmail': [{'Address': 'unit%d@ucalgary.ca' % i}]},
+					'Coordinators': {'Coordinator': [{'Email': self.email(rng)} for _ in range(rng.randint(1, 3))]}
+				})
+			return units
+		return self._memoized('units', generate)
+
+	def principals(self):
+		def generate(rng):
+			principals = []
+			for i in range(self.args.people):
+				user = rng.choice(self.users())
+				kind = rng.random()
+				if kind < 0.5:
+					principals.append(user['email'])
+				elif kind < 0.65:
+					principals.append(user['login'])
+				elif kind < 0.9:
+					# Names typed by hand, which only resolve by fuzzy matching
+					principals.append(perturb(user['name'], rng.randint(0, 2), rng))
+				else:
+					principals.append('former.staff%d@ucalgary.ca' % rng.randint(1, 500))
+			return principals
+		return self._memoized('principals', generate)
+
+	def seed(self, sharepoint):
+		"""Populates ``sharepoint`` with the users and lists the workloads sync to. A
+		share of ``--existing`` of the source rows are already in their list, and a
+		share of ``--changed`` of those have changed since they were written."""
+
+		rng = self._random('seed')
+		existing = lambda: rng.random() < self.args.existing
+		changed = lambda: rng.random() < self.args.changed
+		when = lambda d: d.strftime('%Y-%m-%d %H:%M:%S')
+
+		for user in self.users():
+			sharepoint.add_user(user['login'], user['name'], user['email'])
+
+		sharepoint.add_list(CHOICES_LIST, ({'Title': state, 'ContentType': 'Configuration Item Choice', 'CIChoiceType': 'Lifecycle State'}
+		                                   for state in LIFECYCLE_STATES), title='Choices')
+
+		uc = sharepoint.add_list(UC_LIST, title='UC')
+		site_ids = {}
+		for site in self.sites():
+			site_ids[site['Site Code']] = uc.add({'Title': site['Site Name'], 'CIShortTitle': site['Site Code'], 'CIResourceURL': site['Map URL'], 'ContentType': 'Site'})
+		for b in self.buildings():
+			if existing():
+				address = b['Municipal Address'] if not changed() else '1 Old Road NW'
+				site = [s for s in self.sites() if s['Site Code'] == b['Site Code']][0]
+				uc.add({'Title': b['Building Name'], 'CIShortTitle': b['Abbreviation'], 'CISite': '%d;#%s' % (site_ids[b['Site Code']], site['Site Name']),
+				        'CIExternalReference1': b['Number'], 'WorkAddress': address, 'WorkCity': 'Priddis' if 'Priddis' in address else 'Calgary',
+				        'WorkState': 'Alberta', 'WorkCountry': 'Canada', 'ContentType': 'Building'})
+		for u in self.units():
+			if existing():
+				uc.add({'Title': u['Name'], 'CIExternalReference1': u['Id'], 'CIExternalReference2': u['EntityVersion'] - 1 if changed() else u['EntityVersion'],
+				        'UNITISUnitCode': u['Code'], 'UNITISUnitType': u['Type'], 'ContentType': 'Unit'})
+
+		ci = sharepoint.add_list(CI_LIST, title='CI')
+		for s in self.servers():
+			if existing():
+				modified = s['ModifiedDate'] - datetime.timedelta(days=1) if changed() else s['ModifiedDate']
+				ci.add({'Title': s['ServerName'], 'CIExternalReference1': s['ServerId'], 'CIExternalReference2': s['UCTagNum'], 'ExternalDateModified': when(modified),
+				        'CIHostName': s['HostName'], 'CISupplier': s['Make'], 'CIModel': s['Model'], 'CIReleaseDate': when(s['InstallDate']),
+				        'ContentType': u'Asset—Server' if s['Tier3'] == 'Server' else u'Alias—Virtual Machine'}, folder=CI_FOLDER)
+
+
+class SyncWorkloads(ADSMBase):
+	"""The workloads, each returning the number of source items it processed."""
+
+	def opc(self, dataset):
+		servers = dataset.servers()
+
+		def extract_principal(s):
+			result = re.search(r'[-0-9a-zA-Z.+_]+@[-0-9a-zA-Z.+_]+\.[a-zA-Z]{2,4}', s) if s else None
+			return result.group(0) if result else None
+
+		def extract_person_ref(s):
+			principal = extract_principal(s)
+			return self.person_ref(principal) if principal else None
+
+		def building(s):
+			return self.uc_ref('Building', '_ows_Title', s, fuzzy=True, max_dist=10)
+
+		def site(s):
+			s = {'South Campus': 'Foothills Campus', 'Spy Hill': 'Spyhill Campus', 'UofA': 'University of Alberta'}.get(s, s)
+			return self.uc_ref('Site', '_ows_Title', s, fuzzy=True)
+
+		def status(s):
+			s = {'Development': 'Develop', 'Pre-Production': 'Deploy', 'Production': 'Sustain', 'Production Standby': 'Sustain', 'Testing': 'Test'}.get(s, s)
+			return self.choice_ref('Configuration Item Choice', '_ows_Title', s, fuzzy=True)
+
+		field_map = (
+			('Title', 'ServerName'),
+			('CIDescription', lambda r: ' '.join(filter(lambda x: x, (r['Function1'], r['Function2'])))),
+			('CITechnicalOwner', lambda r: extract_person_ref(r['OwnerContact'])),
+			('CITechnicalAgents', lambda r: ADSMBase.ref_sep.join(filter(lambda x: x, map(extract_person_ref, (r['SystemAdmin1'], r['SystemAdmin2'], r['SystemAdmin3']))))),
+			('CIBusinessOwner', lambda r: extract_person_ref(r['BusinessOwner'])),
+			('CIReleaseDate', lambda r: r['InstallDate'].isoformat().replace('T', ' ')),
+			('CILifecycleState', lambda r: status(r['Status'])),
+			('CIHostName', 'HostName'),
+			('CISupplier', 'Make'),
+			('CIModel', 'Model'),
+			('CISite', lambda r: site(r['SiteGroup'])),
+			('CIBuilding', lambda r: building(r['Site'])),
+			('CIServerZone', lambda r: '-'.join(r['ZoneLocation'].split('-', 2)[:2])),
+			('ExternalDateModified', lambda r: r['ModifiedDate'].isoformat().replace('T', ' ')),
+			('CIExternalReference1', 'ServerId'),
+			('CIExternalReference2', 'UCTagNum')
+		)
+
+		def prefetch_f(rows):
+			self.resolve_people([extract_principal(r[x]) for r in rows for x in ('OwnerContact', 'BusinessOwner', 'SystemAdmin1', 'SystemAdmin2', 'SystemAdmin3')])
+
+		def compare_f(ext_item, list_item):
+			if list_item == None:
+				return 'New'
+			list_item_date = datetime.datetime(*time.strptime(list_item['_ows_ExternalDateModified'], '%Y-%m-%d %H:%M:%S')[:6])
+			return 'Update' if ext_item['ModifiedDate'] > list_item_date else None
+
+		for tier, content_type in (('Server', u'Asset—Server'), ('Virtual Host', u'Alias—Virtual Machine')):
+			self.sync_to_list_by_comparison(self.ci_list_uuid, None, None, '_ows_CIExternalReference1', (s for s in servers if s['Tier3'] == tier), 'ServerId',
+			                                compare_f, field_map, content_type=content_type, folder=CI_FOLDER, prefetch_f=prefetch_f, compare_fields=('ExternalDateModified',))
+		return len(servers)
+
+	def units(self, dataset):
+		units = dataset.units()
+		building_fields = ('ID', 'Title', 'CIShortTitle')
+
+		field_map = (
+			('Title', 'Name'),
+			('CIExternalReference1', 'Id'),
+			('CIExternalReference2', 'EntityVersion'),
+			('UNITISUnitCode', 'Code'),
+			('UNITISUnitType', 'Type'),
+			('UNITISUnitWebsite', 'Website'),
+			('UNITISUnitKeywords', 'Keywords'),
+			('UNITISUnitBuilding', lambda r: self.listitem_ref(self.uc_list_uuid, None, building_fields, '_ows_CIShortTitle', r['Rooms']['ContactRoom'][0]['Room']['BuildingCode'].upper())),
+			('UNITISUnitRoomNumber', lambda r: r['Rooms']['ContactRoom'][0]['Room']['Number']),
+			('UNITISUnitPhone', lambda r: '+%s (%s) %s' % (r['Phones']['ContactPhone'][0]['Phone']['CountryCode'], r['Phones']['ContactPhone'][0]['Phone']['AreaCode'], r['Phones']['ContactPhone'][0]['Phone']['Number'])),
+			('UNITISUnitEmail', lambda r: r['Emails']['ContactEmail'][0]['Address']),
+			('UNITISUnitCoordinators', lambda r: ';#'.join(map(lambda x: self.person_ref(x['Email']), r['Coordinators']['Coordinator'])))
+		)
+
+		def compare_f(ext_item, list_item):
+			if list_item == None:
+				return 'New'
+			return 'Update' if int(ext_item['EntityVersion']) > int(list_item['_ows_CIExternalReference2']) else None
+
+		def prefetch_f(units):
+			self.resolve_people([x['Email'] for r in units for x in r['Coordinators']['Coordinator']])
+
+		self.sync_to_list_by_comparison(self.uc_list_uuid, None, None, '_ows_CIExternalReference1', units, 'Id', compare_f, field_map, content_type='Unit',
+		                                prefetch_f=prefetch_f, ledger=True, compare_fields=('CIExternalReference2',))
+		return len(units)
+
+	def locations(self, dataset):
+		building_field_map = (
+			('Title', 'Building Name'),
+			('CIShortTitle', 'Abbreviation'),
+			('CISite', lambda r: self.listitem_ref(self.uc_list_uuid, None, None, '_ows_CIShortTitle', r['Site Code'])),
+			('CIExternalReference1', 'Number'),
+			('WorkAddress', 'Municipal Address'),
+			('WorkCity', lambda r: 'Priddis' if 'Priddis' in r['Municipal Address'] else 'Calgary'),
+			('WorkState', lambda r: 'Alberta'),
+			('WorkCountry', lambda r: 'Canada')
+		)
+
+		site_field_map = (
+			('Title', 'Site Name'),
+			('CIShortTitle', 'Site Code'),
+			('CIResourceURL', 'Map URL')
+		)
+
+		compare_f = lambda ext_item, list_item: 'New' if list_item == None else 'Update'
+
+		self.sync_to_list_by_comparison(self.uc_list_uuid, None, None, '_ows_CIShortTitle', dataset.sites(), 'Site Code', compare_f, site_field_map,
+		                                content_type='Site', diff=True, ledger=True)
+		self.sync_to_list_by_comparison(self.uc_list_uuid, None, None, '_ows_CIExternalReference1', dataset.buildings(), 'Number', compare_f, building_field_map,
+		                                content_type='Building', diff=True, ledger=True)
+		return len(dataset.sites()) + len(dataset.buildings())
+
+	def people(self, dataset):
+		principals = dataset.principals()
+		for principal in principals:
+			self.person_ref(principal, fuzzy=True)
+		return len(principals)
+
+
+def work(args, adsm_args):
+	"""Runs one workload in this process and prints its result as JSON."""
+
+	dataset = Dataset(args)
+	for rows in WORKLOADS[args.worker]:
+		getattr(dataset, rows)()
+
+	# suds logs the faults it raises, which are counted by the server instead
+	logging.getLogger('suds').addHandler(logging.NullHandler())
+
+	workloads = SyncWorkloads([ENV] + adsm_args)
+	workloads._prep_args()
+	baseline = peak_rss()
+
+	stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+	start = time.time()
+	try:
+		items = getattr(workloads, args.worker)(dataset)
+		error = None
+	except Exception, e:
+		items = 0
+		error = '%s: %s' % (e.__class__.__name__, e)
+	finally:
+		sys.stdout = stdout
+	seconds = time.time() - start
+
+	syncs = getattr(workloads, 'sync_stats', [])
+	print json.dumps({'items': items, 'seconds': seconds, 'peak_mb': peak_rss(), 'baseline_mb': baseline, 'error': error,
+	                  'methods': sum(s['methods'] for s in syncs), 'failed_batches': sum(s['errors'] for s in syncs),
+	                  'failed_methods': sum(s['failed_methods'] for s in syncs),
+	                  'bytes_received': workloads.transport_stats()['bytes_received']})
+
+
+def run(name, url, adsm_args):
+	env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get('PYTHONPATH')))), WSDL_CACHE='')
+	env.update({ENV + '_URL': url, ENV + '_CI_LIST': CI_LIST, ENV + '_UC_LIST': UC_LIST, ENV + '_CHOICES_LIST': CHOICES_LIST})
+	env.pop(ENV + '_CACHE', None)
+
+	p = subprocess.Popen([sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ['--worker', name], stdout=subprocess.PIPE, env=env, cwd=ROOT)
+	out, err = p.communicate()
+	lines = out.strip().splitlines()
+	if p.returncode or not lines:
+		return {'items': 0, 'seconds': 0, 'peak_mb': 0, 'baseline_mb': 0, 'error': 'worker exited with %d' % p.returncode}
+	return json.loads(lines[-1])
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--workload', action='append', choices=WORKLOADS.keys(), help='workload to run, repeatable (default: all)')
+	parser.add_argument('--servers', type=int, default=5000, help='OPC servers (default: %(default)s)')
+	parser.add_argument('--units', type=int, default=2000, help='UNITIS units (default: %(default)s)')
+	parser.add_argument('--buildings', type=int, default=250, help='buildings (default: %(default)s)')
+	parser.add_argument('--sites', type=int, default=12, help='sites (default: %(default)s)')
+	parser.add_argument('--users', type=int, default=3000, help='site users (default: %(default)s)')
+	parser.add_argument('--people', type=int, default=1000, help='principals resolved by the people workload (default: %(default)s)')
+	parser.add_argument('--existing', type=float, default=0.8, help='share of source rows already in their list (default: %(default)s)')
+	parser.add_argument('--changed', type=float, default=0.25, help='share of existing rows that changed since (default: %(default)s)')
+	parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+	parser.add_argument('--row-latency', type=float, default=0.0, help='seconds added for each row read or written')
+	parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with a SOAP fault')
+	parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of requests refused as throttled')
+	parser.add_argument('--method-error-rate', type=float, default=0.0, help='share of UpdateListItems methods that fail')
+	parser.add_argument('--error-ops', help='comma separated operations that faults and throttling apply to (default: all)')
+	parser.add_argument('--seed', type=int, default=1)
+	parser.add_argument('--json', help='write the results to this file')
+	parser.add_argument('--worker', choices=WORKLOADS.keys(), help=argparse.SUPPRESS)
+	args, adsm_args = parser.parse_known_args()
+
+	if args.worker:
+		return work(args, adsm_args)
+
+	dataset = Dataset(args)
+	sharepoint = FakeSharePoint(latency=args.latency, row_latency=args.row_latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+	                            method_error_rate=args.method_error_rate, error_ops=args.error_ops.split(',') if args.error_ops else None, seed=args.seed)
+	url = sharepoint.start()
+
+	results = []
+	print '%-10s %7s %9s %9s %11s %7s %9s %8s' % ('workload', 'items', 'seconds', 'items/s', 'round trips', 'faults', 'peak MB', '+MB')
+	for name in args.workload or WORKLOADS:
+		sharepoint.reset()
+		dataset.seed(sharepoint)
+		result = run(name, url, adsm_args)
+
+		stats = sharepoint.stats
+		result.update(workload=name, round_trips=stats['requests'], faults=stats['faults'] + stats['throttled'],
+		              operations=dict((op, stats[op]) for op in OPERATIONS if stats[op]), rows_returned=stats['rows_returned'], rows_written=stats['rows_written'])
+		results.append(result)
+
+		rate = result['items'] / result['seconds'] if result['seconds'] else 0
+		print '%-10s %7d %9.2f %9.1f %11d %7d %9.1f %+8.1f' % (name, result['items'], result['seconds'], rate, result['round_trips'], result['faults'],
+		                                                     result['peak_mb'], result['peak_mb'] - result['baseline_mb'])
+		print '%-10s %s' % ('', ', '.join('%s %d' % x for x in sorted(result['operations'].items())))
+		if result['error']:
+			print '%-10s failed: %s' % ('', result['error'])
+
+	sharepoint.stop()
+
+	if args.json:
+		with open(args.json, 'w') as f:
+			json.dump({'args': vars(args), 'adsm_args': adsm_args, 'results': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+	main()
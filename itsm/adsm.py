@@ -2,28 +2,110 @@
 # coding=utf-8
 
 import collections
+import datetime
+import hashlib
+import json
+import re
 import os
+import time
 
-from nltk import metrics, stem, tokenize
+# suds.sax.parser times parses with suds.metrics, which it does not import itself
+import suds.metrics
+from suds import WebFault
 from suds.sax.element import Attribute, Element
 from suds.sax.parser import Parser
 
 from itsm.base import Base
+from itsm.batch import THROTTLE_STATUSES, AdaptiveBatchSizer, Backoff, BatchSubmitter, http_status, local_client
+from itsm.cache import LRUCache, PersistentCache, missing
+from itsm.caml import BatchWriter
+from itsm.fuzzy import FuzzyTable, best_match, ngrams
+from itsm.metrics import FieldProfile
+from itsm.rowset import RowStore, Rowset, send_raw
+
+
+_stemmer = None
+
+
+def porter_stemmer():
+	# nltk is slow to import, and only needed once keys are normalized for fuzzy matching
+	global _stemmer
+	if _stemmer is None:
+		from nltk import stem
+		_stemmer = stem.PorterStemmer()
+	return _stemmer
 
 
 class ADSMBase(Base):
 
 	ref_sep = ';#'
+	ref_pattern = re.compile(r'^\d+;#')
 	batch_size = 20
+	batch_size_bounds = (5, 250)
+	batch_target_latency = 10.0
+	batch_max_bytes = 2097152
+	success_code = '0x00000000'
+	# Method error codes worth resubmitting: unspecified errors, which include lock
+	# and database timeouts, and save conflicts with concurrent edits
+	retry_codes = ('0x80004005', '0x81020015')
+	retry_base = 1.0
+	retry_cap = 60.0
+	page_size = 1000
+	principal_chunk_size = 100
+	prefetch_size = 500
+
+	# Keep the rows of keyed tables in a RowStore, projected onto the fields requested
+	compact_rows = True
+
+	# Maximum entries and time to live, in seconds, of each in-memory cache table
+	cache_tables = {
+		None: (1024, 3600),
+		'person_ref': (20000, 3600),
+		'users': (1, 3600),
+		'_get_listitems': (16, 3600),
+		'keyed_listitems': (64, 3600)
+	}
+
+	# Time to live, in seconds, of each persistent cache namespace
+	persistent_cache_ttls = {
+		'person_ref': 604800,
+		'listitem_ref': 86400,
+		'list_snapshot': 2592000,
+		'ledger': 7776000
+	}
+
+	# Lookups that found no ref, so that rows written with one are left out of the
+	# ledger and looked up again on the next run
+	unresolved_refs = 0
+
+	# Normalized fuzzy keys, shared by every table and instance and kept across
+	# reset_caches() so that rebuilt tables do not stem the same strings again.
+	normalized_keys = LRUCache(maxsize=65536)
 
 	def argument_parser(self):
 		parser = super(ADSMBase, self).argument_parser()
 
 		parser.add_argument('env', default='SP_ADSM', nargs='?')
 		parser.add_argument('-d', help='dry run', action='store_true')
+		parser.add_argument('-j', '--jobs', help='number of UpdateListItems batches to keep in flight', type=int, default=1)
+		parser.add_argument('--batch-size', help='fixed batch size, or MIN:MAX bounds for adaptive batch sizing')
+		parser.add_argument('--retries', help='times to retry a throttled batch, and to resubmit its failed methods', type=int, default=5)
+		parser.add_argument('--cache', help='SQLite file caching resolved references between runs (default: $ENV_CACHE)')
+		parser.add_argument('--cache-ttl', help='NAMESPACE=SECONDS time to live of a cache namespace', action='append', default=[])
+		parser.add_argument('--refresh', help='ignore cached references and resolve everything again', action='store_true')
+		parser.add_argument('--incremental', help='keep snapshots of unfiltered lists in the cache and fetch only changes since the last run', action='store_true')
+		parser.add_argument('--stream', help='parse GetListItems responses into row dicts instead of unmarshalling them with suds', action='store_true')
+		parser.add_argument('--profile-fields', help='time each field map and print the slowest fields at the end of the run', action='store_true')
 
 		return parser
 
+	def finish_main(self):
+		super(ADSMBase, self).finish_main()
+
+		if getattr(self, 'field_profile', None):
+			print 'Field map profile:'
+			print self.field_profile.report()
+
 	def _delayed_adsm_client(self, var, sp):
 		if not hasattr(self, var):
 			setattr(self, var, self._named_client(self.args.env, lambda url, **x: self.create_sharepoint_client(url + '/' + sp, **x)))
@@ -40,6 +122,15 @@ class ADSMBase(Base):
 	@property
 	def adsm_usergroup(self): return self._delayed_adsm_client('_adsm_usergroup', 'UserGroup.asmx?WSDL')
 
+	@property
+	def adsm_lists_raw(self):
+		# A Lists client that returns requests unsent, for calls whose replies are parsed by hand
+		if not hasattr(self, '_adsm_lists_raw'):
+			client = self.adsm_lists.clone()
+			client.set_options(nosend=True)
+			setattr(self, '_adsm_lists_raw', client)
+		return getattr(self, '_adsm_lists_raw')
+
 	@property
 	def ci_list_uuid(self): return os.environ[self.args.env + '_CI_LIST']
 	@property
@@ -48,14 +139,28 @@ class ADSMBase(Base):
 	def choices_list_uuid(self): return os.environ[self.args.env + '_CHOICES_LIST']
 
 	# Caching support
+
+	@property
+	def persistent_cache(self):
+		if not hasattr(self, '_persistent_cache'):
+			path = self.args.cache or os.environ.get(self.args.env + '_CACHE')
+			cache = None
+			if path:
+				ttls = dict(self.persistent_cache_ttls)
+				ttls.update((ns, int(ttl)) for ns, ttl in (x.split('=', 1) for x in self.args.cache_ttl))
+				cache = PersistentCache(path, ttls=ttls, refresh=self.args.refresh)
+			setattr(self, '_persistent_cache', cache)
+		return getattr(self, '_persistent_cache')
+
 	def _cachetable(self, name):
 		if not hasattr(self, '_cachetables'):
 			setattr(self, '_cachetables', {})
 		tables = getattr(self, '_cachetables')
 
 		table = tables.get(name)
-		if not table:
-			table = {}
+		if table is None:
+			maxsize, ttl = self.cache_tables.get(name, self.cache_tables[None])
+			table = LRUCache(maxsize=maxsize, ttl=ttl)
 			tables[name] = table
 
 		return table
@@ -63,114 +168,322 @@ class ADSMBase(Base):
 	def reset_caches(self):
 		setattr(self, '_cachetables', {})
 
+	def cache_hits(self):
+		hits = sum(table.hits for table in getattr(self, '_cachetables', {}).values()) + ADSMBase.normalized_keys.hits
+		return hits + (self.persistent_cache.hits if self.persistent_cache else 0)
+
+	def cache_stats(self):
+		return dict((name, table.stats()) for name, table in getattr(self, '_cachetables', {}).items())
+
 	# List functions
 
-	def listitems(self, list_uuid, query=None, fields=('ID', 'Title'), folder=None, limit=9999, cache=True):
+	def listitems(self, list_uuid, query=None, fields=('ID', 'Title'), folder=None, limit=None, cache=True):
 		if cache:
 			table = self._cachetable('_get_listitems')
-			key = '%s/%s/%s/%s' % (list_uuid, query, fields, limit)
-			if key in table:
-				return table[key]
+			key = (list_uuid, unicode(query) if query else None, tuple(fields or ()), folder, limit)
+			list_items_rows = table.get(key)
+			if list_items_rows is not None:
+				return list_items_rows
 
-		query = Element('ns1:query').append(Element('Query').append(Element('Where').append(Element('IsNotNull').append(Element('FieldRef').append(Attribute('Name', 'ID')))))) if not query else query
-		queryOptions = Element('ns1:queryOptions').append(Element('QueryOptions').append(Element('Folder').setText(folder))) if folder else None
-		fields = Element('ns1:viewFields').append(Element('ViewFields').append([Element('FieldRef').append(Attribute('Name', f)) for f in fields])) if fields else None
+		if limit:
+			list_items_rows = list(self._get_listitems(list_uuid, query, fields, folder, limit)[0])
+		else:
+			list_items_rows = list(self.iter_listitems(list_uuid, query=query, fields=fields, folder=folder))
 
-		list_items = self.adsm_lists.service.GetListItems(list_uuid, query=query, viewFields=fields, rowLimit=limit, queryOptions=queryOptions)
-		list_items_rows = list_items.listitems.data.row if int(list_items.listitems.data._ItemCount) > 1 \
-			          else [list_items.listitems.data.row] if int(list_items.listitems.data._ItemCount) > 0 \
-			          else []
 		if cache:
 			table[key] = list_items_rows
 
 		return list_items_rows
 
-	def keyed_listitems(self, list_uuid, query=None, fields=('ID', 'Title'), folder=None, limit=9999, key_field='_ows_Title'):
+	def iter_listitems(self, list_uuid, query=None, fields=('ID', 'Title'), folder=None, page_size=None):
+		# Follow ListItemCollectionPositionNext, holding one page of rows at a time
+		page_size = page_size or self.page_size
+		position = None
+
+		while True:
+			rows, position = self._get_listitems(list_uuid, query, fields, folder, page_size, position)
+			for row in rows:
+				yield row
+
+			if not position:
+				break
+
+	def _get_listitems(self, list_uuid, query, fields, folder, row_limit, position=None):
+		# Rows are parsed into Row dicts as they are iterated with --stream, otherwise
+		# they are suds objects
+		query_e, fields_e, queryOptions = self._listitems_args(query, fields, folder, position)
+		args = dict(query=query_e, viewFields=fields_e, rowLimit=row_limit, queryOptions=queryOptions)
+
+		if getattr(self.args, 'stream', False):
+			rows = Rowset(send_raw(self.adsm_lists_raw, 'GetListItems', list_uuid, **args))
+			return rows, rows.position
+
+		data = self.adsm_lists.service.GetListItems(list_uuid, **args).listitems.data
+		return self._listitems_rows(data), getattr(data, '_ListItemCollectionPositionNext', None)
+
+	def _listitems_args(self, query, fields, folder, position=None):
+		query = Element('ns1:query').append(Element('Query').append(Element('Where').append(Element('IsNotNull').append(Element('FieldRef').append(Attribute('Name', 'ID')))))) if not query else query
+		options = Element('QueryOptions')
+		if folder:
+			options.append(Element('Folder').setText(folder))
+		if position:
+			options.append(Element('Paging').append(Attribute('ListItemCollectionPositionNext', position)))
+		queryOptions = Element('ns1:queryOptions').append(options) if len(options) > 0 else None
+		fields = self.view_fields_element(fields) if fields else None
+
+		return query, fields, queryOptions
+
+	def view_fields_element(self, fields):
+		return Element('ns1:viewFields').append(Element('ViewFields').append([Element('FieldRef').append(Attribute('Name', f)) for f in fields]))
+
+	def view_fields(self, *fields):
+		# Internal names, with or without _ows_, or sequences of them, returned once each after ID.
+		# Empty names, such as a display_field of '', are left out
+		names = ['ID']
+		for f in fields:
+			for name in filter(None, [f] if isinstance(f, basestring) else f or ()):
+				name = name[5:] if name.startswith('_ows_') else name
+				if name not in names:
+					names.append(name)
+		return tuple(names)
+
+	def _listitems_rows(self, data):
+		return data.row if int(data._ItemCount) > 1 \
+		       else [data.row] if int(data._ItemCount) > 0 \
+		       else []
+
+	def synced_listitems(self, list_uuid, fields=('ID', 'Title'), folder=None):
+		# Keep a snapshot of the list in the persistent cache and patch it with the
+		# changes since its token, fetching the list in full only when that fails
+		persistent = self.persistent_cache
+		key = json.dumps([list_uuid, list(fields or ()), folder])
+		snapshot = persistent.get('list_snapshot', key, None)
+
+		current = False
+		if snapshot:
+			try:
+				current = self._apply_list_changes(list_uuid, fields, folder, snapshot)
+			except WebFault, e:
+				print 'Change token for %s rejected, fetching all items: %s' % (list_uuid, e)
+
+		if not current:
+			snapshot = {'token': self._list_change_token(list_uuid), 'rows': {}}
+			for row in self.iter_listitems(list_uuid, fields=fields, folder=folder):
+				row = self._row_dict(row)
+				snapshot['rows'][row['_ows_ID']] = row
+
+		persistent.set('list_snapshot', key, snapshot)
+		return snapshot['rows'].values()
+
+	def _list_change_token(self, list_uuid):
+		# Ask for the changes of no items to learn the list's current change token
+		query = Parser().parse(string='<ns1:query><Query><Where><IsNull><FieldRef Name="ID"/></IsNull></Where></Query></ns1:query>').getChild('query')
+		result = self.adsm_lists.service.GetListItemChangesSinceToken(list_uuid, query=query, rowLimit=1)
+		return result.listitems.Changes._LastChangeToken
+
+	def _apply_list_changes(self, list_uuid, fields, folder, snapshot):
+		# Returns False if the snapshot cannot be patched and must be rebuilt
+		while True:
+			query_e, fields_e, queryOptions = self._listitems_args(None, fields, folder)
+			result = self.adsm_lists.service.GetListItemChangesSinceToken(list_uuid, query=query_e, viewFields=fields_e, rowLimit=self.page_size,
+			                                                              queryOptions=queryOptions, changeToken=snapshot['token'])
+			changes = result.listitems.Changes
+
+			# A List element is returned when the list's schema has changed
+			if hasattr(changes, 'List'):
+				return False
+
+			ids = getattr(changes, 'Id', [])
+			for change in ids if isinstance(ids, list) else [ids]:
+				if change._ChangeType == 'InvalidToken':
+					return False
+				if change._ChangeType in ('Delete', 'MoveAway'):
+					snapshot['rows'].pop(unicode(getattr(change, 'value', change)), None)
+
+			for row in self._listitems_rows(result.listitems.data):
+				row = self._row_dict(row)
+				snapshot['rows'][row['_ows_ID']] = row
+
+			snapshot['token'] = changes._LastChangeToken
+			if getattr(changes, '_MoreChanges', 'False').lower() != 'true':
+				return True
+
+	def _row_dict(self, row):
+		return row if isinstance(row, dict) else dict(row)
+
+	def _row_get(self, row, field):
+		return row.get(field) if isinstance(row, collections.Mapping) else row.__dict__.get(field)
+
+	def keyed_listitems(self, list_uuid, query=None, fields=('ID', 'Title'), folder=None, limit=None, key_field='_ows_Title'):
 		table = self._cachetable('keyed_listitems')
-		key = '%s/%s/%s/%s/%s' % (list_uuid, query, fields, limit, key_field)
-		if key in table:
-			return table[key]
-		
-		listitems = self.listitems(list_uuid, query=query, fields=fields, folder=folder, limit=limit)
-		keyed_listitems = dict(filter(lambda x: x[0], map(lambda x: (x.__dict__.get(key_field), x), listitems)))
+		key = (list_uuid, unicode(query) if query else None, tuple(fields or ()), folder, limit, key_field)
+		keyed_listitems = table.get(key)
+		if keyed_listitems is not None:
+			return keyed_listitems
+
+		if limit:
+			listitems = self.listitems(list_uuid, query=query, fields=fields, folder=folder, limit=limit)
+		# Changes are not reported for items that stop matching a query, so filtered
+		# lists are always fetched in full
+		elif not query and getattr(self.args, 'incremental', False) and self.persistent_cache:
+			listitems = self.synced_listitems(list_uuid, fields=fields, folder=folder)
+		else:
+			listitems = self.iter_listitems(list_uuid, query=query, fields=fields, folder=folder)
+		# The exact and fuzzy tables of a list share the compact rows of one store
+		store = RowStore(tuple(fields) + ('ID', key_field) if fields else None) if self.compact_rows else None
+		keyed_listitems = {}
+		for x in listitems:
+			k = self._row_get(x, key_field)
+			if k:
+				keyed_listitems[k] = store.add(x) if store else x
 		table[key] = keyed_listitems
 
 		return keyed_listitems
 
-	def fuzzy_keyed_listitems(self, list_uuid, query=None, fields=('ID', 'Title'), folder=None, limit=9999, key_field='_ows_Title'):
+	def fuzzy_keyed_listitems(self, list_uuid, query=None, fields=('ID', 'Title'), folder=None, limit=None, key_field='_ows_Title'):
 		table = self._cachetable('keyed_listitems')
-		key = '%s/%s/%s/%s/%s/fuzzy' % (list_uuid, query, fields, limit, key_field)
-		if key in table:
-			return table[key]
-		
-		listitems = self.listitems(list_uuid, query=query, fields=fields, folder=folder, limit=limit)
-		keyed_listitems = dict(filter(lambda x: x[0], map(lambda x: (self.normalize(x.__dict__.get(key_field)), x), listitems)))
+		key = (list_uuid, unicode(query) if query else None, tuple(fields or ()), folder, limit, key_field, 'fuzzy')
+		keyed_listitems = table.get(key)
+		if keyed_listitems is not None:
+			return keyed_listitems
+
+		listitems = self.keyed_listitems(list_uuid, query=query, fields=fields, folder=folder, limit=limit, key_field=key_field)
+		keyed_listitems = FuzzyTable(filter(lambda x: x[0], ((self.normalize(k), x) for k, x in listitems.items())))
 		table[key] = keyed_listitems
 
 		return keyed_listitems
 
-	def normalize(self, s, stemmer=stem.PorterStemmer()):
-		words = tokenize.wordpunct_tokenize(s.lower().strip())
-		return ' '.join([stemmer.stem(w) for w in words])
+	def normalize(self, s, stemmer=None):
+		if stemmer:
+			from nltk import tokenize
+
+			words = tokenize.wordpunct_tokenize(s.lower().strip())
+			return ' '.join([stemmer.stem(w) for w in words])
+
+		normalized = ADSMBase.normalized_keys.get(s)
+		if normalized is None:
+			normalized = self.normalize(s, stemmer=porter_stemmer())
+			ADSMBase.normalized_keys[s] = normalized
+		return normalized
 
 	def fuzzy_match(self, fuzzy_keyed_listitems, s, max_dist=4):
 		normalized_key = self.normalize(s)
-		candidates = filter(lambda y: y[0] <= max_dist, ((metrics.edit_distance(x[0], normalized_key), x[1]) for x in fuzzy_keyed_listitems.items()))
-		candidates.sort(lambda x, y: x[0] - y[0])
+		if isinstance(fuzzy_keyed_listitems, FuzzyTable):
+			match = fuzzy_keyed_listitems.nearest(normalized_key, max_dist)
+		else:
+			match = best_match(((k, v, ngrams(k)) for k, v in fuzzy_keyed_listitems.iteritems()), normalized_key, max_dist)
 
-		return candidates[0][1] if len(candidates) > 0 else None
+		return match[1] if match else None
 
 	# Reference functions
 
 	def person_ref(self, principal, fuzzy=False, max_dist=4):
 		if not principal:
 			return None
-		if principal in self.person_ref._cache:
-			return self.person_ref._cache.get(principal)
+		ref = self._cachetable('person_ref').get(self._person_key(principal, fuzzy, max_dist), missing)
+		if ref is missing:
+			ref = self.resolve_people([principal], fuzzy=fuzzy, max_dist=max_dist).get(principal)
+		if ref is None:
+			self.unresolved_refs += 1
+		return ref
+
+	def _person_key(self, principal, fuzzy, max_dist):
+		return '%s~%d' % (principal, max_dist) if fuzzy else principal
+
+	def resolve_people(self, principals, fuzzy=False, max_dist=4):
+		# Resolve every uncached principal in bulk, fuzzy matching unresolved ones
+		# against the site's users in a second pass, and cache the refs
+		cache = self._cachetable('person_ref')
+		persistent = self.persistent_cache
+		key = lambda p: self._person_key(p, fuzzy, max_dist)
+
+		refs = {}
+		for principal in collections.OrderedDict.fromkeys(p for p in principals if p):
+			ref = cache.get(key(principal), missing)
+			if ref is missing and persistent:
+				# Caches written before unresolved refs were left out may still hold them
+				ref = persistent.get('person_ref', key(principal))
+				if ref is None:
+					ref = missing
+				if ref is not missing:
+					cache[key(principal)] = ref
+			refs[principal] = ref
+
+		principals = [p for p, ref in refs.items() if ref is missing]
+		if not principals:
+			return refs
 
-		def resolve(p):
-			principals = Element('ns1:principalKeys').append(Element('ns1:string').setText(p))
-			result = self.adsm_people.service.ResolvePrincipals(principals, 'User', True)
-			return result.PrincipalInfo[0]
+		candidates = self._resolve_principals(principals)
 
-		candidate = resolve(principal)
-		if not candidate.IsResolved and fuzzy:
+		if fuzzy:
 			# Attempt to find a username principal
-			cache = self._cachetable('person_ref')
-			table = cache.get('FuzzyUserCollection')
-			if not table:
-				rows = self.adsm_usergroup.service.GetUserCollectionFromSite().GetUserCollectionFromSite.Users.User
-				table = dict((self.normalize(r['_Name']), r) for r in rows)
-				cache['FuzzyUserCollection'] = table
-
-			user = self.fuzzy_match(table, principal, max_dist=max_dist)
-			if user:
-				principal = user['_LoginName']
-				candidate = resolve(principal)
-		if not candidate.IsResolved:
-			self.person_ref._cache[principal] = None
-			return None
-		elif candidate.AccountName.startswith('UC_ADMIN') or candidate.AccountName.startswith('UC_CAMPUS'):
-			# if the resolved candidate is a UC_ADMIN or UC_CAMPUS account,
-			# attempt to find an equivalent UC account
-			uc_principal = candidate.AccountName.replace('UC_ADMIN', 'UC').replace('UC_CAMPUS', 'UC')
-			uc_candidate = resolve(uc_principal)
-			if uc_candidate.IsResolved:
-				candidate = uc_candidate
-
-		ref = '%s%s%s' % (candidate.UserInfoID, ADSMBase.ref_sep, candidate.DisplayName)
-		self.person_ref._cache[principal] = ref
-		return ref
-	person_ref._cache = {}
+			logins = {}
+			for principal, candidate in candidates.items():
+				if not candidate.IsResolved:
+					user = self.fuzzy_match(self._fuzzy_user_table(), principal, max_dist=max_dist)
+					if user:
+						logins[principal] = user['_LoginName']
+			resolved = self._resolve_principals(logins.values())
+			for principal, login in logins.items():
+				candidates[principal] = resolved[login]
+
+		# If a resolved candidate is a UC_ADMIN or UC_CAMPUS account,
+		# attempt to find an equivalent UC account
+		uc_principals = {}
+		for principal, candidate in candidates.items():
+			if candidate.IsResolved and (candidate.AccountName.startswith('UC_ADMIN') or candidate.AccountName.startswith('UC_CAMPUS')):
+				uc_principals[principal] = candidate.AccountName.replace('UC_ADMIN', 'UC').replace('UC_CAMPUS', 'UC')
+		resolved = self._resolve_principals(uc_principals.values())
+		for principal, uc_principal in uc_principals.items():
+			if resolved[uc_principal].IsResolved:
+				candidates[principal] = resolved[uc_principal]
+
+		for principal, candidate in candidates.items():
+			refs[principal] = '%s%s%s' % (candidate.UserInfoID, ADSMBase.ref_sep, candidate.DisplayName) if candidate.IsResolved else None
+			cache[key(principal)] = refs[principal]
+
+		if persistent:
+			# Principals that did not resolve may be added to the site later
+			persistent.update('person_ref', ((key(p), refs[p]) for p in candidates if refs[p] is not None))
+
+		return refs
+
+	def _resolve_principals(self, principals):
+		principals = list(collections.OrderedDict.fromkeys(principals))
+		infos = []
+		for i in range(0, len(principals), self.principal_chunk_size):
+			chunk = principals[i:i + self.principal_chunk_size]
+			keys = Element('ns1:principalKeys').append([Element('ns1:string').setText(p) for p in chunk])
+			result = self.adsm_people.service.ResolvePrincipals(keys, 'User', True)
+			infos.extend(result.PrincipalInfo)
+		return dict(zip(principals, infos))
+
+	def _fuzzy_user_table(self):
+		cache = self._cachetable('users')
+		table = cache.get('FuzzyUserCollection')
+		if not table:
+			rows = self.adsm_usergroup.service.GetUserCollectionFromSite().GetUserCollectionFromSite.Users.User
+			table = FuzzyTable((self.normalize(r['_Name']), r) for r in rows)
+			cache['FuzzyUserCollection'] = table
+		return table
 
 	def people_refs(self, principals, fuzzy=False, max_dist=4):
 		if not principals:
 			return None
 		if isinstance(principals, basestring):
 			principals = [principals]
+		self.resolve_people(principals, fuzzy=fuzzy, max_dist=max_dist)
 		return ADSMBase.ref_sep.join(filter(lambda x: x, map(lambda y: self.person_ref(y, fuzzy=fuzzy, max_dist=max_dist), principals)))
 
 	def listitem_ref(self, list_uuid, query, viewFields, field, field_value, display_field='_ows_Title', fuzzy=False, max_dist=4):
+		viewFields = self.view_fields(viewFields, field, display_field)
+		persistent = self.persistent_cache
+		if persistent:
+			persistent_key = json.dumps([list_uuid, unicode(query) if query else None, viewFields, field, field_value, display_field, fuzzy, max_dist])
+			ref = persistent.get('listitem_ref', persistent_key)
+			if ref is not missing and ref is not None:
+				return ref
+
 		# Attempt to get exact match
 		table = self.keyed_listitems(list_uuid, query=query, fields=viewFields, key_field=field)
 		match = table.get(field_value)
@@ -180,7 +493,14 @@ class ADSMBase(Base):
 			fuzzy_table = self.fuzzy_keyed_listitems(list_uuid, query=query, fields=viewFields, key_field=field)
 			match = self.fuzzy_match(fuzzy_table, field_value, max_dist=max_dist)
 
-		return '%s%s%s' % (match['_ows_ID'], ADSMBase.ref_sep, match[display_field] if display_field else '') if match else None
+		ref = '%s%s%s' % (match['_ows_ID'], ADSMBase.ref_sep, match[display_field] if display_field else '') if match else None
+		if ref is None:
+			if field_value:
+				self.unresolved_refs += 1
+		elif persistent:
+			persistent.set('listitem_ref', persistent_key, ref)
+
+		return ref
 
 	def listitem_refs(self, list_uuid, query, viewFields, field, field_values, display_field='_ows_Title', fuzzy=False, max_dist=4):
 		if not field_values:
@@ -202,73 +522,294 @@ class ADSMBase(Base):
 		list_uuid = getattr(self, '%s_list_uuid' % listname)
 		query = Parser().parse(string=str('<ns1:query><Query><Where><Eq><FieldRef Name="ContentType"/><Value Type="Text">%s</Value></Eq></Where></Query></ns1:query>' % content_type)).getChild('query') \
 		        if content_type else None
-		viewFields = ('ID', 'Title', field[5:] if field.startswith('_ows_') else field)
 
-		return self.listitem_ref(list_uuid, query, viewFields, field, field_value, display_field=display_field, fuzzy=fuzzy, max_dist=max_dist)
+		return self.listitem_ref(list_uuid, query, None, field, field_value, display_field=display_field, fuzzy=fuzzy, max_dist=max_dist)
+
+	# Batch functions
+
+	def batch_sizer(self, list_uuid, content_type=None):
+		# Sizers are kept so later syncs start from the size learned by earlier ones
+		sizers = self.__dict__.setdefault('_batch_sizers', {})
+		key = (list_uuid, content_type)
+		if key not in sizers:
+			minimum, maximum = self.batch_size_bounds
+			spec = getattr(self.args, 'batch_size', None)
+			if spec:
+				bounds = [int(x) for x in spec.split(':', 1)]
+				minimum, maximum = bounds[0], bounds[-1]
+			sizers[key] = AdaptiveBatchSizer(size=max(minimum, min(maximum, ADSMBase.batch_size)), minimum=minimum, maximum=maximum,
+			                                 target_latency=self.batch_target_latency, max_bytes=self.batch_max_bytes)
+		return sizers[key]
+
+	@property
+	def backoff(self):
+		# Shared by every batch, so throttling seen by one slows down the others
+		if not hasattr(self, '_backoff'):
+			setattr(self, '_backoff', Backoff(attempts=getattr(self.args, 'retries', 5), base=self.retry_base, cap=self.retry_cap))
+		return getattr(self, '_backoff')
+
+	def _method_result_list(self, result):
+		results = getattr(getattr(result, 'Results', None), 'Result', [])
+		return results if isinstance(results, list) else [results]
+
+	def method_results(self, result):
+		return [(r._ID.split(',', 1)[0], unicode(r.ErrorCode), getattr(r, 'ErrorText', None)) for r in self._method_result_list(result)]
+
+	def update_listitems(self, list_uuid, batch, nbytes=0, sizer=None):
+		# Throttled batches are sent again, and methods failing with one of retry_codes
+		# resubmitted alone. Other failures are not retried, as the batch may have been
+		# applied and resending its New methods would duplicate items.
+		backoff = self.backoff
+		result, merged = None, collections.OrderedDict()
+		# Throttles and resubmits each have backoff.attempts retries, and throttles are
+		# counted again after every reply that gets through
+		throttles = resubmits = 0
+		if sizer and len(batch) < sizer.minimum:
+			# The last batch of a run may hold fewer methods than the sizer's minimum
+			sizer = None
+		while True:
+			backoff.wait()
+			try:
+				reply = self._update_listitems(list_uuid, batch, nbytes, sizer)
+			except Exception, e:
+				status = http_status(e)
+				if status not in THROTTLE_STATUSES or throttles >= backoff.attempts:
+					raise
+				throttles += 1
+				delay = backoff.delay(throttles)
+				backoff.throttled(delay)
+				print 'Throttled with HTTP %d, retrying in %.1fs (%d of %d)' % (status, delay, throttles, backoff.attempts)
+				continue
+			finally:
+				# Only the first send of a sized batch is reported to its sizer
+				sizer = None
+			throttles = 0
+
+			if result is None:
+				result = reply
+			for r in self._method_result_list(reply):
+				merged[r._ID.split(',', 1)[0]] = r
+
+			if not isinstance(batch, BatchWriter):
+				break
+			failed = [method_id for method_id, error_code, error_text in self.method_results(reply) if error_code in self.retry_codes]
+			if not failed or resubmits >= backoff.attempts:
+				break
+			resubmits += 1
+			delay = backoff.delay(resubmits)
+			print 'Resubmitting %d failed methods in %.1fs (%d of %d)' % (len(failed), delay, resubmits, backoff.attempts)
+			time.sleep(delay)
+			batch, nbytes = batch.subset(failed), 0
+
+		if resubmits and merged:
+			result.Results.Result = merged.values()
+		return result
+
+	def _update_listitems(self, list_uuid, batch, nbytes=0, sizer=None):
+		if isinstance(batch, BatchWriter):
+			updates = batch.element()
+			nbytes = nbytes or batch.nbytes
+		else:
+			updates = Element('ns1:updates').append(batch)
+		start = time.time()
+		try:
+			result = local_client(self, 'adsm_lists', self.adsm_lists).service.UpdateListItems(listName=list_uuid, updates=updates)
+		except:
+			if sizer:
+				sizer.observe(len(batch), time.time() - start, nbytes, error=True)
+			raise
+		if sizer:
+			sizer.observe(len(batch), time.time() - start, nbytes)
+
+		return result
 
 	# Sync functions
 
-	def sync_to_list_by_comparison(self, list_uuid, query, viewFields, list_items_compare_key, ext_items, ext_items_compare_key, compare_f, field_map, content_type='Item', folder=None, fuzzy=False, max_dist=4, commit=True):
+	def _field_values(self, ext_item, field_map):
+		profile = None
+		if getattr(self.args, 'profile_fields', False):
+			profile = self.__dict__.setdefault('field_profile', FieldProfile())
+
+		values = []
+		for dst, src in field_map:
+			if profile:
+				start, hits, error = time.time(), self.cache_hits(), False
+			try:
+				if not isinstance(src, basestring):
+					v = src(ext_item)
+				elif isinstance(ext_item, collections.Mapping):
+					v = ext_item.get(src)
+				else:
+					v = getattr(ext_item, src, None)
+			except:
+				v = None
+				error = True
+			if profile:
+				profile.record(dst, time.time() - start, self.cache_hits() - hits, error)
+			values.append((dst, v))
+		return values
+
+	def ledger_hash(self, ext_item, field_map, content_type):
+		# Hash the mapped fields and content type too, so changing the map invalidates it
+		to_json = lambda x: dict(x) if hasattr(x, '__keylist__') else unicode(x)
+		data = json.dumps([content_type, [dst for dst, src in field_map], ext_item], sort_keys=True, default=to_json)
+		return hashlib.sha1(data).hexdigest()
+
+	def same_field_value(self, value, list_value):
+		# Empty values match each other, refs match on their IDs and only numbers are
+		# compared numerically
+		if value is None or value == '':
+			return list_value is None or list_value == ''
+		if list_value is None:
+			return False
+
+		if isinstance(value, bool):
+			value = int(value)
+		elif isinstance(value, (datetime.date, datetime.datetime)):
+			value = value.isoformat().replace('T', ' ')
+		number = value if isinstance(value, (int, long, float)) else None
+
+		text = lambda x: x.decode('utf-8') if isinstance(x, str) else unicode(x)
+		value, list_value = text(value).strip(), text(list_value).strip()
+		if value == list_value:
+			return True
+
+		refs = self.ref_pattern.match(value) and self.ref_pattern.match(list_value)
+		if refs:
+			return value.split(ADSMBase.ref_sep)[::2] == list_value.split(ADSMBase.ref_sep)[::2]
+
+		if number is None:
+			return False
+		try:
+			return float(number) == float(list_value)
+		except ValueError:
+			return False
+
+	def _prefetched(self, items, prefetch_f):
+		# Pass each run of prefetch_size items to prefetch_f before yielding them
+		def prefetch(chunk):
+			try:
+				prefetch_f(chunk)
+			except Exception, e:
+				# References that failed to prefetch are resolved one at a time by the field maps
+				print 'Prefetch failed: %s' % e
+
+		chunk = []
+		for item in items:
+			chunk.append(item)
+			if len(chunk) >= self.prefetch_size:
+				prefetch(chunk)
+				for x in chunk:
+					yield x
+				chunk = []
+		if chunk:
+			prefetch(chunk)
+			for x in chunk:
+				yield x
+
+	def sync_to_list_by_comparison(self, list_uuid, query, viewFields, list_items_compare_key, ext_items, ext_items_compare_key, compare_f, field_map, content_type='Item', folder=None, fuzzy=False, max_dist=4, commit=True, jobs=None, prefetch_f=None, diff=False, ledger=False, compare_fields=()):
+		# Fetch only the compare key, the fields compare_f reads and, to diff updates
+		# against them, the mapped fields, along with any viewFields given
+		viewFields = self.view_fields(viewFields, list_items_compare_key, compare_fields, [dst for dst, src in field_map] if diff else ())
+
 		table = self.keyed_listitems(list_uuid, query=query, fields=viewFields, folder=folder, key_field=list_items_compare_key)
 		if fuzzy:
 			fuzzy_table = self.fuzzy_keyed_listitems(list_uuid, query=query, fields=viewFields, folder=folder, key_field=list_items_compare_key)
 
-		method_idx = 1
-		batch = Element('Batch')\
-		       .append(Attribute('OnError', 'Continue'))\
-		       .append(Attribute('ListVersion', 1))
-		if folder:
-			batch.append(Attribute('RootFolder', folder))
+		def new_batch():
+			attrs = [('OnError', 'Continue'), ('ListVersion', 1)]
+			if folder:
+				attrs.append(('RootFolder', folder))
+			return BatchWriter('Batch', attrs)
 
 		def update(b):
-			if commit:
-				updates = Element('ns1:updates').append(b)
-				print self.adsm_lists.service.UpdateListItems(listName=list_uuid, updates=updates)
-
-		for ext_item in ext_items:
-			list_item = table.get(ext_item[ext_items_compare_key])
-			if not list_item and fuzzy:
-				list_item = self.fuzzy_match(fuzzy_table, ext_item[ext_items_compare_key], max_dist=4)
-
-			method_cmd = compare_f(ext_item, list_item)
-			if not method_cmd:
-				continue
+			return self.update_listitems(list_uuid, b[0], sizer=sizer)
+
+		def report(r):
+			submitter.report(r)
+			results = self.method_results(r.result) if r.result else []
+			for method_id, error_code, error_text in results:
+				if error_code != self.success_code:
+					failed_methods.append(method_id)
+					print 'Method %s failed: %s %s' % (method_id, error_code, error_text or '')
+			if ledger:
+				# Record the hashes of only the methods SharePoint confirmed
+				entries = r.batch[1]
+				ledger.update('ledger', (entries[method_id] for method_id, error_code, error_text in results
+				                         if error_code == self.success_code and method_id in entries))
+
+		ledger = self.persistent_cache if ledger else None
+		sizer = self.batch_sizer(list_uuid, content_type)
+		submitter = BatchSubmitter(update, jobs=jobs or getattr(self.args, 'jobs', 1), report_f=report)
+		method_idx = 1
+		unchanged = 0
+		skipped = []
+		failed_methods = []
+		batch, batch_ledger = new_batch(), {}
+
+		def matched(ext_items):
+			for ext_item in ext_items:
+				list_item = table.get(ext_item[ext_items_compare_key])
+				if not list_item and fuzzy:
+					list_item = self.fuzzy_match(fuzzy_table, ext_item[ext_items_compare_key], max_dist=4)
+
+				# Skip items that exist and whose source row is unchanged since it was last
+				# written, and those compare_f leaves alone, before references are prefetched
+				ledger_key = ledger_hash = None
+				if ledger:
+					ledger_key = json.dumps([list_uuid, content_type, ext_item[ext_items_compare_key]])
+					ledger_hash = self.ledger_hash(ext_item, field_map, content_type)
+					if list_item and ledger.get('ledger', ledger_key, None) == ledger_hash:
+						skipped.append(ledger_key)
+						continue
+
+				method_cmd = compare_f(ext_item, list_item)
+				if method_cmd:
+					yield ext_item, list_item, method_cmd, ledger_key, ledger_hash
+
+		items = matched(ext_items)
+		if prefetch_f:
+			items = self._prefetched(items, lambda chunk: prefetch_f([x[0] for x in chunk]))
+
+		in_sync = []
+		for ext_item, list_item, method_cmd, ledger_key, ledger_hash in items:
 			item_id = list_item['_ows_ID'] if list_item else 'New'
 
+			unresolved = self.unresolved_refs
+			values = self._field_values(ext_item, field_map)
+			if self.unresolved_refs != unresolved:
+				# Leave rows with a missing ref out of the ledger so they are looked up again
+				ledger_key = None
+			if diff and list_item and method_cmd == 'Update':
+				values = [(dst, v) for dst, v in values if not self.same_field_value(v, self._row_get(list_item, '_ows_' + dst))]
+				if not values:
+					unchanged += 1
+					if ledger_key:
+						in_sync.append((ledger_key, ledger_hash))
+					continue
+
 			# Prepare a method for this new or update item
-			method = Element('Method')\
-			        .append(Attribute('ID', method_idx))\
-			        .append(Attribute('Cmd', method_cmd))\
-			        .append(Element('Field')\
-			          .append(Attribute('Name', 'ID'))\
-			          .setText(item_id))\
-			        .append(Element('Field')\
-			        	.append(Attribute('Name', 'ContentType'))\
-			        	.setText(content_type))
-			
-			for dst, src in field_map:
-				try:
-					if not isinstance(src, basestring):
-						v = src(ext_item)
-					elif isinstance(ext_item, collections.Mapping):
-						v = ext_item.get(src)
-					else:
-						v = getattr(ext_item, src, None)
-				except:
-					v = None
-				e = Element('Field')\
-				   .append(Attribute('Name', dst))\
-				   .setText(v)
-				method.append(e)
-
-			batch.append(method)
-			print method
+			method_xml = batch.method(method_idx, method_cmd, [('ID', item_id), ('ContentType', content_type)] + values)
+			print method_xml.encode('utf-8')
+			if ledger_key:
+				batch_ledger[str(method_idx)] = (ledger_key, ledger_hash)
 			method_idx += 1
 
-			if len(batch) > ADSMBase.batch_size:
-				update(batch)
-				batch.detachChildren()
+			if len(batch) >= sizer.size:
+				if commit:
+					submitter.submit((batch, batch_ledger))
+				batch, batch_ledger = new_batch(), {}
+
+		if len(batch) > 0 and commit:
+			submitter.submit((batch, batch_ledger))
+
+		results = submitter.finish()
+		if ledger and commit:
+			ledger.update('ledger', in_sync)
 
-		if len(batch) > 0:
-			update(batch)
+		stats = dict(sizer.stats(), batches=len(results), list=list_uuid, content_type=content_type, methods=method_idx - 1, unchanged=unchanged, skipped=len(skipped), errors=len(submitter.errors),
+		             failed_methods=len(failed_methods))
+		self.__dict__.setdefault('sync_stats', []).append(stats)
+		print 'Synced %(methods)d methods to %(list)s in %(batches)d batches (%(errors)d batches and %(failed_methods)d methods failed, %(unchanged)d unchanged, %(skipped)d skipped by ledger), batch size %(batch_size_min)d-%(batch_size_max)d, now %(batch_size)d' % stats
 
+		return results
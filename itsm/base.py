@@ -3,6 +3,7 @@
 
 import os
 import sys
+import time
 
 
 class Base(object):
@@ -16,34 +17,58 @@ class Base(object):
 
 		self._prep_args()
 
+		# Profile setup and main, in the background process too, when asked to
+		profiler = None
+		if self.args.profile or self.args.trace_memory:
+			from itsm.profiling import RunProfiler
+			profiler = RunProfiler(self.__class__.__name__, cpu_dir=self.args.profile, memory_dir=self.args.trace_memory)
+			profiler.start()
+
 		# Give subclasses an opportunity to perform additional setup functions
 		# before main is invoked.
 		self.prepare_for_main()
 
-		if not self.args.background:
-			result = self.main()
-		else:
-			import daemon
-			import grp
-			import pwd
-			import signal
-			from lockfile.pidlockfile import PIDLockFile
-			
-			# Create and configure the daemon context
-			ctx = daemon.DaemonContext()
-			ctx.umask = 0o027
-			ctx.pidfile = PIDLockFile(self.args.pidfile)
-			# ctx.signal_map = {
-			# 	signal.SIGTERM: # program_cleanup,
-			# 	signal.SIGUP: 'terminate',
-			# 	signal.SIGUSR1: # reload_program_config
-			# }
-			ctx.uid = pwd.getpwnam('nobody').pw_uid
-			ctx.gid = grp.getgrnam('nobody').gr_gid
-			
-			# Daemonize by running within the daemon context
-			with ctx:
+		started = time.time()
+		result = 1
+		try:
+			if not self.args.background:
 				result = self.main()
+			else:
+				import daemon
+				import grp
+				import pwd
+				import signal
+				from lockfile.pidlockfile import PIDLockFile
+				
+				# Create and configure the daemon context
+				ctx = daemon.DaemonContext()
+				ctx.umask = 0o027
+				ctx.pidfile = PIDLockFile(self.args.pidfile)
+				# ctx.signal_map = {
+				# 	signal.SIGTERM: # program_cleanup,
+				# 	signal.SIGUP: 'terminate',
+				# 	signal.SIGUSR1: # reload_program_config
+				# }
+				ctx.uid = pwd.getpwnam('nobody').pw_uid
+				ctx.gid = grp.getgrnam('nobody').gr_gid
+				
+				# Daemonize by running within the daemon context
+				with ctx:
+					result = self.main()
+		finally:
+			if profiler:
+				for path in profiler.stop():
+					print 'Wrote profile to %s' % path
+
+			# Record failed runs too, with an exit code of 1
+			if self.args.metrics_dir:
+				self.export_metrics(self.args.metrics_dir, started, result)
+
+		self.finish_main()
+
+		stats = self.transport_stats()
+		if stats['bytes_received']:
+			print 'Received %(bytes_received)d bytes, %(bytes_decoded)d decompressed, in %(requests)d SOAP requests (%(compressed_responses)d compressed)' % stats
 
 		# Exit with the code returned from main.
 		sys.exit(result)
@@ -57,6 +82,10 @@ class Base(object):
 		
 		parser.add_argument('-b', '--background', help='run as a background process', default=False, action='store_true')
 		parser.add_argument('-p', '--pidfile', help='set the background PID FILE', default='/var/run/%s.pid' % self.__class__.__name__)
+		# Made absolute before a background process changes directory
+		parser.add_argument('--metrics-dir', help='write SOAP call metrics of the run to DIR as JSON and Prometheus text', metavar='DIR', type=os.path.abspath)
+		parser.add_argument('--profile', help='profile the CPU time of the run and write pstats and a summary to DIR', metavar='DIR', type=os.path.abspath)
+		parser.add_argument('--trace-memory', help='trace the memory allocated by the run and write the top allocations to DIR', metavar='DIR', type=os.path.abspath)
 
 		return parser
 
@@ -83,6 +112,13 @@ class Base(object):
 		"""
 		pass
 
+	def finish_main(self):
+		"""A stub method, the counterpart of ``prepare_for_main``, called after main
+		returns. Library classes may implement it to report on the run. Subclasses
+		should call super on this function if it is implemented.
+		"""
+		pass
+
 	def couchdb_client(self, name):
 		return self._named_client(name, self.create_couchdb_client)
 
@@ -131,23 +167,93 @@ class Base(object):
 		return db
 
 	def create_sharepoint_client(self, url, USERNAME=None, PASSWORD=None, **args):
-		if USERNAME and '\\' in USERNAME:
-			from suds.transport.https import WindowsHttpAuthenticated
+		# Clients with the same credentials, such as the Lists, People, Webs and
+		# UserGroup clients of an environment, share a pool of authenticated connections
+		return self.create_ws_client(url, transport=self.pooled_transport(USERNAME, PASSWORD))
+
+	def transport_stats(self):
+		"""Returns the requests made and bytes sent, received and decoded through all
+		pooled transports."""
+
+		import collections
+
+		stats = collections.Counter(requests=0, bytes_sent=0, bytes_received=0, bytes_decoded=0, compressed_responses=0)
+		for transport in getattr(self, '_transports', {}).values():
+			stats.update(transport.stats)
+		return stats
 
-			transport = WindowsHttpAuthenticated(username=USERNAME, password=PASSWORD)
-			return self.create_ws_client(url, transport=transport)
-		else:
-			return self.create_ws_client(url, username=USERNAME, password=PASSWORD)
+	@property
+	def soap_metrics(self):
+		"""The ``SOAPMetrics`` recording every call made through pooled transports."""
+
+		if not hasattr(self, '_soap_metrics'):
+			from itsm.metrics import SOAPMetrics
+			setattr(self, '_soap_metrics', SOAPMetrics())
+		return getattr(self, '_soap_metrics')
+
+	def export_metrics(self, directory, started, result):
+		"""Writes the SOAP call metrics of a run that started at ``started`` and
+		returned ``result`` to ``directory``."""
+
+		from itsm.metrics import write_metrics
+
+		finished = time.time()
+		exit_code = 0 if result is None else result if isinstance(result, int) else 1
+		run = {'started': started, 'finished': finished, 'seconds': finished - started, 'exit_code': exit_code}
+		try:
+			write_metrics(directory, self.__class__.__name__, run, self.soap_metrics.summary())
+		except (IOError, OSError), e:
+			print 'Could not write metrics to %s: %s' % (directory, e)
+
+	def pooled_transport(self, username=None, password=None):
+		"""Returns a transport for a new client that shares its pool of connections
+		with every other client created with the same credentials."""
+
+		from itsm.transport import PooledTransport
+
+		transports = self.__dict__.setdefault('_transports', {})
+		transport = transports.get((username, password))
+		if transport is None:
+			transport = PooledTransport(username=username, password=password, metrics=self.soap_metrics)
+			transports[(username, password)] = transport
+		return transport.share()
 
 	def create_ws_client(self, wsdl_url, **args):
 		from suds.client import Client
 
 		# Explicitly set prettyxml to True to get around suds bugs
 		args['prettyxml'] = True
+
+		if 'transport' not in args:
+			args['transport'] = self.pooled_transport(args.pop('username', None), args.pop('password', None))
+
+		# Create clients from parsed definitions cached by earlier runs
+		if self.wsdl_cache and 'cache' not in args:
+			args['cache'] = self.wsdl_cache
+			args['cachingpolicy'] = 1
 	
 		# return Client(wsdl_url, cache=None, **args)
 		return Client(wsdl_url, **args)
 
+	@property
+	def wsdl_cache(self):
+		"""The ``WSDLCache`` in ``$WSDL_CACHE``, by default ``~/.cache/itsm/wsdl``, keeping
+		entries for ``$WSDL_CACHE_TTL`` seconds, by default a day. None if the variable is
+		empty or the directory can't be created."""
+
+		if not hasattr(self, '_wsdl_cache'):
+			from itsm.wsdlcache import WSDLCache
+
+			location = os.environ.get('WSDL_CACHE', os.path.expanduser('~/.cache/itsm/wsdl'))
+			cache = None
+			if location:
+				try:
+					cache = WSDLCache(location, duration=int(os.environ.get('WSDL_CACHE_TTL', 86400)))
+				except OSError, e:
+					print 'WSDL cache disabled: %s' % e
+			setattr(self, '_wsdl_cache', cache)
+		return getattr(self, '_wsdl_cache')
+
 	def create_mssql_client(self, host, NAME=None, USERNAME=None, PASSWORD=None, **args):
 		import pymssql
 		return pymssql.connect(host, USERNAME, PASSWORD, NAME)
\ No newline at end of file
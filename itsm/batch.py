@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import collections
+import random
+import sys
+import threading
+import time
+
+
+BatchResult = collections.namedtuple('BatchResult', ('index', 'batch', 'result', 'error'))
+
+# HTTP statuses of requests the server refused because it is overloaded
+THROTTLE_STATUSES = (429, 503)
+
+
+class BatchSubmitter(object):
+	"""Submits batches through ``submit_f`` with up to ``jobs`` batches in flight at
+	once. Results are collected, and passed to ``report_f``, in the order the batches
+	were submitted regardless of the order in which they complete. A batch that raises
+	is recorded with its error instead of aborting the remaining batches."""
+
+	def __init__(self, submit_f, jobs=1, report_f=None):
+		self.submit_f = submit_f
+		self.jobs = max(1, jobs or 1)
+		self.report_f = report_f or self.report
+		self.results = []
+
+		self._pending = collections.deque()
+		self._pool = None
+		if self.jobs > 1:
+			from multiprocessing.pool import ThreadPool
+			self._pool = ThreadPool(self.jobs)
+
+	def submit(self, batch):
+		index = len(self.results) + len(self._pending) + 1
+
+		if not self._pool:
+			self._collect(index, batch, self._call(batch))
+			return
+
+		self._pending.append((index, batch, self._pool.apply_async(self._call, (batch,))))
+		while len(self._pending) > self.jobs:
+			self._collect(*self._pending.popleft())
+
+	def finish(self):
+		while self._pending:
+			self._collect(*self._pending.popleft())
+		if self._pool:
+			self._pool.close()
+			self._pool.join()
+			self._pool = None
+
+		return self.results
+
+	@property
+	def errors(self):
+		return [r for r in self.results if r.error]
+
+	def _call(self, batch):
+		try:
+			return self.submit_f(batch), None
+		except Exception:
+			return None, sys.exc_info()[1]
+
+	def _collect(self, index, batch, outcome):
+		if hasattr(outcome, 'get'):
+			outcome = outcome.get()
+		result = BatchResult(index, batch, *outcome)
+		self.results.append(result)
+		self.report_f(result)
+
+	def report(self, result):
+		if result.error:
+			print 'Batch %d failed: %s' % (result.index, result.error)
+		else:
+			print result.result
+
+
+def local_client(owner, name, client):
+	"""Returns a per-thread clone of ``client`` stored on ``owner``. suds clients keep
+	per-call state, so each submitting thread needs its own."""
+
+	local = owner.__dict__.setdefault('_local_clients', threading.local())
+	c = getattr(local, name, None)
+	if c is None:
+		c = client.clone()
+		setattr(local, name, c)
+	return c
+
+
+class AdaptiveBatchSizer(object):
+	"""Chooses how many methods to put in the next batch. The size grows by ``step``
+	while full batches complete within ``target_latency`` seconds and ``max_bytes``,
+	shrinks in proportion to the overshoot when a batch is slow or large, and halves
+	when a batch fails. The size always stays within ``minimum`` and ``maximum``."""
+
+	def __init__(self, size=20, minimum=1, maximum=200, target_latency=10.0, max_bytes=2097152, step=None):
+		self.minimum = minimum
+		self.maximum = max(minimum, maximum)
+		self.target_latency = target_latency
+		self.max_bytes = max_bytes
+		self.step = step or max(1, size / 4)
+		self.size = self._clamp(size)
+		self.sizes = []
+
+		self._lock = threading.Lock()
+
+	def observe(self, count, seconds, nbytes=0, error=False):
+		assert self.minimum <= count <= self.maximum, 'batch of %d methods observed outside %d-%d' % (count, self.minimum, self.maximum)
+		with self._lock:
+			self.sizes.append(count)
+
+			if error:
+				size = self.size / 2
+			elif seconds > self.target_latency or nbytes > self.max_bytes:
+				overshoot = max(seconds / self.target_latency, float(nbytes) / self.max_bytes)
+				size = int(count / overshoot)
+			elif count >= self.size:
+				size = self.size + self.step
+				if nbytes:
+					size = min(size, int(self.max_bytes / (float(nbytes) / count)))
+			else:
+				size = self.size
+
+			self.size = self._clamp(size)
+			return self.size
+
+	def stats(self):
+		sizes = self.sizes or [0]
+		return {
+			'batches': len(self.sizes),
+			'batch_size': self.size,
+			'batch_size_min': min(sizes),
+			'batch_size_max': max(sizes),
+			'batch_size_mean': float(sum(sizes)) / max(1, len(self.sizes))
+		}
+
+	def _clamp(self, size):
+		return max(self.minimum, min(self.maximum, size))
+
+
+def http_status(error):
+	"""Returns the HTTP status of a failed suds call, which suds raises as an
+	``Exception`` of ``(status, reason)`` for statuses other than 200 and 500, or
+	None for other errors."""
+
+	args = getattr(error, 'args', ())
+	if len(args) == 1 and isinstance(args[0], tuple) and args[0] and isinstance(args[0][0], int):
+		return args[0][0]
+	return None
+
+
+class Backoff(object):
+	"""Exponential backoff with full jitter. Retry ``attempt``, counting from 1,
+	waits a random time of up to ``base`` seconds doubled for each earlier attempt,
+	and at most ``cap`` seconds, so that callers retrying at once spread out. A
+	throttled caller pauses, through ``wait``, every caller sharing the backoff
+	until its delay has passed, so batches in flight on other threads slow down too."""
+
+	def __init__(self, attempts=5, base=1.0, cap=60.0, seed=None):
+		self.attempts = attempts
+		self.base = base
+		self.cap = cap
+		self.retries = 0
+		self.throttles = 0
+
+		self._random = random.Random(seed)
+		self._resume_at = 0
+		self._lock = threading.Lock()
+
+	def delay(self, attempt):
+		with self._lock:
+			self.retries += 1
+			return self._random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+
+	def throttled(self, delay):
+		with self._lock:
+			self.throttles += 1
+			self._resume_at = max(self._resume_at, time.time() + delay)
+
+	def wait(self):
+		with self._lock:
+			pause = self._resume_at - time.time()
+		if pause > 0:
+			time.sleep(pause)
@@ -17,7 +17,6 @@ class BuildingDetailsToADSM(ADSMBase):
 
 	# Production
 	uc_list = '{8E3E8107-9FEF-406F-880E-8C980E7400EE}'
-	key_fields = ('ID', 'Title')
 
 	def argument_parser(self):
 		parser = super(BuildingDetailsToADSM, self).argument_parser()
@@ -78,7 +77,10 @@ class BuildingDetailsToADSM(ADSMBase):
 		def compare_f(ext_item, list_item):
 			return 'Update' if list_item else None
 
-		self.sync_to_list_by_comparison(BuildingDetailsToADSM.uc_list, None, BuildingDetailsToADSM.key_fields, '_ows_Title', rows(), 'AdjustedBuilding', compare_f, field_map, content_type='Building', fuzzy=True, commit=not self.args.d)
+		def prefetch_f(buildings):
+			self.resolve_people([r['Facility Manager'][1] for r in buildings if isinstance(r.get('Facility Manager'), tuple)])
+
+		self.sync_to_list_by_comparison(BuildingDetailsToADSM.uc_list, None, None, '_ows_Title', rows(), 'AdjustedBuilding', compare_f, field_map, content_type='Building', fuzzy=True, commit=not self.args.d, prefetch_f=prefetch_f, ledger=True)
 
 	def buildings(self):
 		# Fetch the list of all buildings
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import collections
+import json
+import sys
+import threading
+import time
+
+
+# Returned by cache lookups that miss when no default is given, so that a cached
+# None can be told apart from a miss.
+missing = object()
+
+
+class LRUCache(object):
+	"""A thread safe mapping that holds at most ``maxsize`` entries, evicting the least
+	recently used entry when full, and optionally expiring entries ``ttl`` seconds
+	after they were stored. Lookup hits and misses and evictions are counted."""
+
+	def __init__(self, maxsize=1024, ttl=None):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+		self._entries = collections.OrderedDict()
+		self._lock = threading.RLock()
+
+	def get(self, key, default=None):
+		with self._lock:
+			try:
+				value, stored = self._entries.pop(key)
+			except KeyError:
+				self.misses += 1
+				return default
+			if self.ttl is not None and time.time() - stored > self.ttl:
+				self.evictions += 1
+				self.misses += 1
+				return default
+			self._entries[key] = (value, stored)
+			self.hits += 1
+			return value
+
+	def __getitem__(self, key):
+		value = self.get(key, missing)
+		if value is missing:
+			raise KeyError(key)
+		return value
+
+	def __setitem__(self, key, value):
+		with self._lock:
+			self._entries.pop(key, None)
+			self._entries[key] = (value, time.time())
+			while len(self._entries) > self.maxsize:
+				self._entries.popitem(last=False)
+				self.evictions += 1
+
+	def __contains__(self, key):
+		with self._lock:
+			entry = self._entries.get(key)
+			return entry is not None and (self.ttl is None or time.time() - entry[1] <= self.ttl)
+
+	def __len__(self):
+		return len(self._entries)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+	def memory(self):
+		"""Returns an estimate, in bytes, of the memory held by the cached keys and
+		values. Containers are measured one level deep."""
+
+		def size(x):
+			n = sys.getsizeof(x)
+			if isinstance(x, dict):
+				n += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in x.iteritems())
+			elif isinstance(x, (list, tuple)):
+				n += sum(sys.getsizeof(v) for v in x)
+			return n
+
+		with self._lock:
+			return sum(size(k) + size(v) for k, (v, stored) in self._entries.iteritems())
+
+	def stats(self):
+		return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'memory': self.memory()}
+
+
+class PersistentCache(object):
+	"""A cache of JSON serializable values in a local SQLite file, partitioned into
+	namespaces that each have their own time to live in seconds. Several processes
+	may share one file, and expired entries are removed whenever one opens it. With
+	``refresh`` set, lookups always miss but new values are still stored, forcing a
+	refresh of everything that is used. Lookup hits and misses are counted."""
+
+	def __init__(self, path, ttls=None, default_ttl=86400, refresh=False):
+		import sqlite3
+
+		self.path = path
+		self.ttls = dict(ttls or {})
+		self.default_ttl = default_ttl
+		self.refresh = refresh
+		self.hits = 0
+		self.misses = 0
+
+		self._lock = threading.RLock()
+		self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+		with self._db:
+			self._db.execute('PRAGMA journal_mode=WAL')
+			self._db.execute('CREATE TABLE IF NOT EXISTS cache (namespace TEXT, key TEXT, value TEXT, stored REAL, PRIMARY KEY (namespace, key))')
+		self.expire()
+
+	def ttl(self, namespace):
+		return self.ttls.get(namespace, self.default_ttl)
+
+	def get(self, namespace, key, default=missing):
+		"""Returns the unexpired value stored for ``key``, or ``default``, which is
+		``missing`` unless given."""
+
+		if self.refresh:
+			self.misses += 1
+			return default
+		with self._lock:
+			row = self._db.execute('SELECT value FROM cache WHERE namespace = ? AND key = ? AND stored >= ?',
+			                       (namespace, key, time.time() - self.ttl(namespace))).fetchone()
+			if row:
+				self.hits += 1
+			else:
+				self.misses += 1
+		return json.loads(row[0]) if row else default
+
+	def set(self, namespace, key, value):
+		self.update(namespace, ((key, value),))
+
+	def update(self, namespace, items):
+		now = time.time()
+		with self._lock, self._db:
+			self._db.executemany('INSERT OR REPLACE INTO cache (namespace, key, value, stored) VALUES (?, ?, ?, ?)',
+			                     ((namespace, key, json.dumps(value), now) for key, value in items))
+
+	def invalidate(self, namespace=None):
+		"""Removes every entry in ``namespace``, or in all namespaces, and returns the
+		number of entries removed."""
+
+		with self._lock, self._db:
+			if namespace:
+				return self._db.execute('DELETE FROM cache WHERE namespace = ?', (namespace,)).rowcount
+			return self._db.execute('DELETE FROM cache').rowcount
+
+	def expire(self):
+		"""Removes the entries that have outlived their namespace's time to live and
+		returns the number of entries removed."""
+
+		now = time.time()
+		with self._lock, self._db:
+			namespaces = [row[0] for row in self._db.execute('SELECT DISTINCT namespace FROM cache')]
+			return sum(self._db.execute('DELETE FROM cache WHERE namespace = ? AND stored < ?', (namespace, now - self.ttl(namespace))).rowcount
+			           for namespace in namespaces)
+
+	def namespaces(self):
+		with self._lock:
+			return self._db.execute('SELECT namespace, COUNT(*) FROM cache GROUP BY namespace').fetchall()
+
+	def close(self):
+		with self._lock:
+			self._db.close()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import re
+
+from suds.sax.element import Element
+from suds.sax.text import Raw
+
+
+_text_entities = {'<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&apos;'}
+_bare_ampersand = re.compile(u'&(?!(amp|lt|gt|quot|apos);)')
+
+
+def escape(value):
+	"""Returns ``value`` as XML escaped unicode text, escaped as suds escapes the
+	text of elements, which leaves ampersands that start an entity alone. None
+	becomes empty text, as it does for suds elements."""
+
+	if value is None:
+		return u''
+	if isinstance(value, str):
+		value = value.decode('utf-8')
+	elif not isinstance(value, unicode):
+		value = unicode(value)
+	if '&' in value:
+		value = _bare_ampersand.sub(u'&amp;', value)
+	if '<' in value or '>' in value or '"' in value or "'" in value:
+		value = u''.join(_text_entities.get(c, c) for c in value)
+	return value
+
+
+def tag(name, attrs=(), text=None, children=()):
+	"""Returns the XML for an element with ``attrs``, a sequence of name and value
+	pairs, and either escaped ``text`` or ``children``, a sequence of XML strings."""
+
+	start = u''.join((u'<', name) + tuple(u' %s="%s"' % (k, escape(v)) for k, v in attrs))
+	body = u''.join(children) if children else escape(text)
+	if not body:
+		return start + u'/>'
+	return u''.join((start, u'>', body, u'</', name, u'>'))
+
+
+class BatchWriter(object):
+	"""Accumulates the ``Method`` elements of an ``UpdateListItems`` batch, or of the
+	``Fields`` of an ``UpdateList`` or ``UpdateColumns`` call, as XML text. Each
+	method is serialized once, when it is added, and the batch is handed to suds as
+	raw text, avoiding building and serializing a suds element per field."""
+
+	def __init__(self, root='Batch', attrs=()):
+		self.root = root
+		self.attrs = tuple(attrs)
+		self.methods = []
+		self.nbytes = 0
+
+	def method(self, method_id, cmd, fields):
+		"""Adds a method with a ``Field`` for each name and value pair in ``fields``
+		and returns its XML."""
+
+		children = [tag('Field', (('Name', name),), value) for name, value in fields]
+		return self.append(method_id, tag('Method', (('ID', method_id), ('Cmd', cmd)), children=children))
+
+	def append(self, method_id, xml):
+		"""Adds the XML of a method that was built elsewhere and returns it."""
+
+		self.methods.append((unicode(method_id), xml))
+		self.nbytes += len(xml.encode('utf-8'))
+		return xml
+
+	def subset(self, method_ids):
+		"""Returns a batch with the same root and attributes holding only the methods
+		in ``method_ids``, in the order they were added, e.g. to resubmit those that
+		failed."""
+
+		method_ids = set(unicode(x) for x in method_ids)
+		batch = BatchWriter(self.root, self.attrs)
+		for method_id, xml in self.methods:
+			if method_id in method_ids:
+				batch.append(method_id, xml)
+		return batch
+
+	def __len__(self):
+		return len(self.methods)
+
+	def xml(self):
+		return tag(self.root, self.attrs, children=[xml for method_id, xml in self.methods])
+
+	def element(self, name='ns1:updates'):
+		"""Returns a suds element named ``name`` containing the batch as raw XML."""
+
+		return Element(name).setText(Raw(self.xml()))
@@ -1,9 +1,8 @@
 #!/usr/bin/env python
 # coding=utf-8
 
-from suds.sax.element import Attribute, Element
-
 from itsm.adsm import ADSMBase
+from itsm.caml import BatchWriter
 
 
 class DeleteItems(ADSMBase):
@@ -20,30 +19,22 @@ class DeleteItems(ADSMBase):
 	def main(self):
 		items = self.adsm_lists.service.GetListItems(self.args.list, self.args.view).listitems.data.row
 
+		sizer = self.batch_sizer(self.args.list, 'Delete')
 		method_idx = 1
-		batch = Element('Batch')\
-		       .append(Attribute('OnError', 'Continue'))\
-		       .append(Attribute('ListVersion', 1))
+		new_batch = lambda: BatchWriter('Batch', (('OnError', 'Continue'), ('ListVersion', 1)))
+		batch = new_batch()
 
 		def update(b):
 			if not self.args.d:
-				updates = Element('ns1:updates').append(b)
-				print self.adsm_lists.service.UpdateListItems(listName=self.args.list, updates=updates)
+				print self.update_listitems(self.args.list, b, sizer=sizer)
 
 		for item in items:
-			method = Element('Method')\
-			        .append(Attribute('ID', method_idx))\
-			        .append(Attribute('Cmd', 'Delete'))\
-			        .append(Element('Field')\
-			          .append(Attribute('Name', 'ID'))\
-			          .setText(item['_ows_ID']))
-			batch.append(method)
-			print method
+			print batch.method(method_idx, 'Delete', (('ID', item['_ows_ID']),)).encode('utf-8')
 			method_idx += 1
 
-			if len(batch) > 20:
+			if len(batch) >= sizer.size:
 				update(batch)
-				batch.detachChildren()
+				batch = new_batch()
 
 		if len(batch) > 0:
 			update(batch)
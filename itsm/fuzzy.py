@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import collections
+
+
+def edit_distance(a, b, max_dist=None):
+	"""Returns the Levenshtein distance between ``a`` and ``b``. If ``max_dist`` is
+	given, only the diagonal band of width ``2 * max_dist + 1`` is computed and
+	``max_dist + 1`` is returned as soon as the distance must exceed ``max_dist``."""
+
+	if len(a) < len(b):
+		a, b = b, a
+	la, lb = len(a), len(b)
+	if max_dist is None:
+		max_dist = la
+	if la - lb > max_dist:
+		return max_dist + 1
+	if lb == 0:
+		return la
+
+	over = max_dist + 1
+	previous = range(lb + 1)
+	for i in xrange(1, la + 1):
+		ca = a[i - 1]
+		lo, hi = max(1, i - max_dist), min(lb, i + max_dist)
+		current = [over] * (lb + 1)
+		current[0] = i if i <= max_dist else over
+		row_min = current[0]
+		for j in xrange(lo, hi + 1):
+			d = previous[j - 1] + (ca != b[j - 1])
+			if previous[j] + 1 < d:
+				d = previous[j] + 1
+			if current[j - 1] + 1 < d:
+				d = current[j - 1] + 1
+			if d > over:
+				d = over
+			current[j] = d
+			if d < row_min:
+				row_min = d
+		if row_min > max_dist:
+			return over
+		previous = current
+
+	return min(previous[lb], over)
+
+
+def ngrams(s, n=2):
+	return collections.Counter(s[i:i + n] for i in xrange(len(s) - n + 1))
+
+
+def shared_ngrams(a, b):
+	if len(a) > len(b):
+		a, b = b, a
+	return sum(min(c, b[g]) for g, c in a.iteritems() if g in b)
+
+
+def best_match(candidates, key, max_dist, n=2):
+	"""Scans ``candidates``, a sequence of ``(key, value, ngrams)`` tuples, for the
+	key closest to ``key`` within ``max_dist`` and returns ``(distance, value)`` or
+	None. Candidates are pruned by length difference and by the count of shared
+	n-grams before any distance is computed, and each distance is bounded by the
+	best distance found so far. Ties go to the earliest candidate."""
+
+	key_grams = ngrams(key, n)
+	best = None
+	bound = max_dist
+
+	for candidate, value, grams in candidates:
+		if abs(len(candidate) - len(key)) > bound:
+			continue
+
+		# An edit touches at most n n-grams, so strings within bound edits of each
+		# other share at least this many.
+		if max(len(candidate), len(key)) - n + 1 - bound * n > shared_ngrams(key_grams, grams):
+			continue
+
+		d = edit_distance(key, candidate, bound)
+		if d <= bound:
+			best = (d, value)
+			if d == 0:
+				break
+			bound = d - 1
+
+	return best
+
+
+class FuzzyTable(dict):
+	"""A dict of normalized keys to values that answers nearest-key queries with
+	``best_match`` over candidates prepared once, and again when keys are added."""
+
+	def __init__(self, *args, **kwargs):
+		super(FuzzyTable, self).__init__(*args, **kwargs)
+		self._candidates = None
+
+	@property
+	def candidates(self):
+		if self._candidates is None or len(self._candidates) != len(self):
+			self._candidates = [(key, value, ngrams(key)) for key, value in self.iteritems()]
+		return self._candidates
+
+	def nearest(self, key, max_dist):
+		return best_match(self.candidates, key, max_dist)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import sys
+
+from itsm.adsm import ADSMBase
+
+
+class InvalidateCache(ADSMBase):
+
+	def argument_parser(self):
+		parser = super(InvalidateCache, self).argument_parser()
+
+		parser.add_argument('-n', '--namespace', help='cache namespace to invalidate (default: all)', action='append')
+
+		return parser
+
+	def main(self):
+		cache = self.persistent_cache
+		if not cache:
+			sys.exit('No cache configured. Pass --cache or set %s_CACHE.' % self.args.env)
+
+		for namespace, count in cache.namespaces():
+			print '%s: %d entries' % (namespace, count)
+
+		for namespace in self.args.namespace or [None]:
+			print 'Removed %d entries from %s' % (cache.invalidate(namespace), namespace or 'all namespaces')
+
+
+def main(args=None):
+	return InvalidateCache(args=args).run()
+
+
+if __name__ == '__main__':
+	main()
@@ -3,10 +3,6 @@
 
 import logging
 
-from xlrd import open_workbook
-from rules.rules import Model
-from rules.context import Context
-
 from itsm.adsm import ADSMBase
 
 
@@ -31,11 +27,16 @@ class LoadCI(ADSMBase):
 	#                'Release_x0020_Status', 'Repository_x0020_URL', 'Shutdown_x0020__x002f__x0020_Sta',
 	#                'Support_x0020_Contact_x0020_Info', 'ID', 'Email_x0020_follow_x0020_up_x002', 'Title')
 
+	# Fields of AD Applications read by the field maps' functions and compare_f
+	apps_lookup_fields = ('Unit', 'ApplicationSystemOwner', 'Developer_x0020_1', 'Developer_x0020_2', 'BusinessContacts',
+	                      'BusinessSystemOwnerIncumbent', 'Origin', 'LifecyclePhase', 'FundedBy', 'BusinessService')
+
 	def argument_parser(self):
 		parser = super(LoadCI, self).argument_parser()
 
 		parser.add_argument('phase')
 		parser.add_argument('model', default='../../Data/AD_Applications.irl', nargs='?', help='model file')
+		parser.add_argument('--model-fields', help='comma separated AD Applications fields read by the model; if given, only the fields used are fetched instead of the whole view')
 
 		return parser
 
@@ -46,6 +47,9 @@ class LoadCI(ADSMBase):
 		return getattr(self, '_opc')
 
 	def prepare_for_main(self):
+		from rules.context import Context
+		from rules.rules import Model
+
 		self.model = Model.modelFromFile(self.args.model)
 		self.ctx = Context(model=self.model)
 		self.ctx['phase'] = self.args.phase
@@ -213,7 +217,12 @@ class LoadCI(ADSMBase):
 
 		# Get the list items from AD Applications
 		print 'Loading AD Applications'
-		list_items = self.adsm_lists.service.GetListItems(LoadCI.apps_list, LoadCI.apps_view, rowLimit="2").listitems.data.row
+		field_map = phase_maps[ctx['phase']]
+		apps_fields = None
+		if self.args.model_fields:
+			apps_fields = self.view_fields_element(self.view_fields([src for dst, src in field_map if isinstance(src, basestring)],
+			                                                        LoadCI.apps_lookup_fields, self.args.model_fields.split(',')))
+		list_items = self.adsm_lists.service.GetListItems(LoadCI.apps_list, LoadCI.apps_view, viewFields=apps_fields, rowLimit="2").listitems.data.row
 		# list_items = self.adsm_lists.service.GetListItems(LoadCI.apps_list, LoadCI.apps_view).listitems.data.row
 		print '   Done AD Applications'
 		def rows():
@@ -239,10 +248,13 @@ class LoadCI(ADSMBase):
 
 			return None
 
+		def prefetch_f(rows):
+			self.resolve_people([r.get('_ows_ApplicationSystemOwner') for r in rows], fuzzy=True)
+
 		# logging.basicConfig(level=logging.INFO)
 		# logging.getLogger('suds.client').setLevel(logging.DEBUG)
 
-		self.sync_to_list_by_comparison(self.ci_list_uuid, None, ('ID', 'Title', 'CIExternalReference1'), '_ows_CIExternalReference1', rows(), '_ows_ID', compare_f, phase_maps[ctx['phase']], content_type=unicode(ctx['contentType'], 'utf-8'), folder=ctx['folder'], commit=not self.args.d)
+		self.sync_to_list_by_comparison(self.ci_list_uuid, None, None, '_ows_CIExternalReference1', rows(), '_ows_ID', compare_f, field_map, content_type=unicode(ctx['contentType'], 'utf-8'), folder=ctx['folder'], commit=not self.args.d, prefetch_f=prefetch_f)
 
 
 def main(args=None):
@@ -12,7 +12,6 @@ class LocationsToADSM(ADSMBase):
 
 	# Production
 	uc_list = '{8E3E8107-9FEF-406F-880E-8C980E7400EE}'
-	key_fields = ('ID', 'Title', 'CISiteCode', 'CIExternalReference1')
 		
 	def argument_parser(self):
 		parser = super(LocationsToADSM, self).argument_parser()
@@ -32,7 +31,7 @@ class LocationsToADSM(ADSMBase):
 		building_field_map = (
 			('Title', 'Building Name'),
 			('CIShortTitle', 'Abbreviation'),
-			('CISite', lambda r: self.listitem_ref(LocationsToADSM.uc_list, None, ('CIShortTitle', 'ID', 'Title'), '_ows_CIShortTitle', r['Site Code'])),
+			('CISite', lambda r: self.listitem_ref(LocationsToADSM.uc_list, None, None, '_ows_CIShortTitle', r['Site Code'])),
 			('CIExternalReference1', 'Number'),
 			('WorkAddress', 'Municipal Address'),
 			('WorkCity', lambda r: 'Priddis' if 'Priddis' in r['Municipal Address'] else 'Calgary'),
@@ -65,8 +64,8 @@ class LocationsToADSM(ADSMBase):
 				return 'Update'
 
 		# Sync
-		self.sync_to_list_by_comparison(LocationsToADSM.uc_list, None, LocationsToADSM.key_fields, '_ows_CIShortTitle', rows(site_headers, sites_sheet), 'Site Code', compare_f, site_field_map, content_type='Site', commit=not self.args.d)
-		self.sync_to_list_by_comparison(LocationsToADSM.uc_list, None, LocationsToADSM.key_fields, '_ows_CIExternalReference1', rows(building_headers, buildings_sheet), 'Number', compare_f, building_field_map, content_type='Building', commit=not self.args.d)
+		self.sync_to_list_by_comparison(LocationsToADSM.uc_list, None, None, '_ows_CIShortTitle', rows(site_headers, sites_sheet), 'Site Code', compare_f, site_field_map, content_type='Site', commit=not self.args.d, diff=True, ledger=True)
+		self.sync_to_list_by_comparison(LocationsToADSM.uc_list, None, None, '_ows_CIExternalReference1', rows(building_headers, buildings_sheet), 'Number', compare_f, building_field_map, content_type='Building', commit=not self.args.d, diff=True, ledger=True)
 
 
 def main(args=None):
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import collections
+import json
+import math
+import os
+import tempfile
+import threading
+
+
+OUTCOMES = ('ok', 'fault', 'error')
+
+
+def percentile(values, p):
+	"""Returns the ``p`` percentile, between 0 and 1, of sorted ``values`` by the
+	nearest rank method."""
+
+	if not values:
+		return None
+	return values[max(0, int(math.ceil(p * len(values))) - 1)]
+
+
+def soap_operation(headers):
+	"""Returns the name of the operation a SOAP request calls, from its SOAPAction
+	header, e.g. ``GetListItems`` for ``"http://.../soap/GetListItems"``."""
+
+	action = dict((k.lower(), v) for k, v in headers.items()).get('soapaction', '')
+	return action.strip('"').rsplit('/', 1)[-1] or 'unknown'
+
+
+class SOAPMetrics(object):
+	"""A thread safe record of SOAP calls by operation: how many were made, their
+	latencies, the bytes sent and received, how many were retried and whether each
+	succeeded, raised a SOAP fault or failed otherwise."""
+
+	def __init__(self):
+		self._latencies = collections.defaultdict(list)
+		self._counts = collections.defaultdict(collections.Counter)
+		self._lock = threading.Lock()
+
+	def record(self, operation, seconds, bytes_sent=0, bytes_received=0, retries=0, outcome='ok'):
+		with self._lock:
+			self._latencies[operation].append(seconds)
+			counts = self._counts[operation]
+			counts['calls'] += 1
+			counts[outcome] += 1
+			counts['bytes_sent'] += bytes_sent
+			counts['bytes_received'] += bytes_received
+			counts['retries'] += retries
+
+	def summary(self):
+		"""Returns the calls, outcomes, bytes, retries, total seconds and p50, p95 and
+		maximum latency of each operation, and the same totals for all operations."""
+
+		with self._lock:
+			latencies = dict((op, sorted(x)) for op, x in self._latencies.items())
+			counts = dict((op, collections.Counter(x)) for op, x in self._counts.items())
+
+		def summarize(latencies, counts):
+			s = dict((k, counts[k]) for k in ('calls', 'bytes_sent', 'bytes_received', 'retries') + OUTCOMES)
+			s.update(seconds=sum(latencies), p50=percentile(latencies, 0.5), p95=percentile(latencies, 0.95), max=latencies[-1] if latencies else None)
+			return s
+
+		operations = dict((op, summarize(latencies[op], counts[op])) for op in latencies)
+		totals = summarize(sorted(x for op in latencies for x in latencies[op]), sum(counts.values(), collections.Counter()))
+		return {'operations': operations, 'totals': totals}
+
+
+class FieldProfile(object):
+	"""Totals, by destination field, the time spent evaluating field maps, the calls
+	made, the exceptions swallowed and the cache hits made while evaluating them."""
+
+	def __init__(self):
+		self.fields = collections.defaultdict(collections.Counter)
+
+	def record(self, field, seconds, cache_hits=0, error=False):
+		totals = self.fields[field]
+		totals['calls'] += 1
+		totals['seconds'] += seconds
+		totals['errors'] += int(error)
+		totals['cache_hits'] += cache_hits
+
+	def report(self):
+		"""Returns a table of the fields, slowest first."""
+
+		total = sum(x['seconds'] for x in self.fields.values()) or 1
+		lines = ['%-32s %8s %10s %8s %9s %8s %10s' % ('field', 'calls', 'seconds', '%', 'ms/call', 'errors', 'cache hits')]
+		for field, x in sorted(self.fields.items(), key=lambda f: f[1]['seconds'], reverse=True):
+			lines.append('%-32s %8d %10.3f %7.1f%% %9.3f %8d %10d' % (field, x['calls'], x['seconds'], 100.0 * x['seconds'] / total,
+			                                                         1000.0 * x['seconds'] / x['calls'], x['errors'], x['cache_hits']))
+		return '\n'.join(lines)
+
+
+def write_atomic(path, data):
+	"""Writes ``data`` to a temporary file and renames it over ``path``, so that
+	readers such as a metrics collector never see a partial file."""
+
+	fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp-')
+	try:
+		with os.fdopen(fd, 'wb') as f:
+			f.write(data)
+		os.rename(tmp, path)
+	except:
+		os.remove(tmp)
+		raise
+
+
+def prometheus_text(script, run, summary):
+	"""Returns ``summary`` and the ``run`` of ``script`` in the Prometheus text
+	exposition format."""
+
+	lines = []
+	label = lambda **labels: '{%s}' % ','.join('%s="%s"' % (k, unicode(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in sorted(labels.items()))
+
+	def metric(name, kind, help, samples):
+		lines.append('# HELP %s %s' % (name, help))
+		lines.append('# TYPE %s %s' % (name, kind))
+		for suffix, labels, value in samples:
+			if value is not None:
+				lines.append('%s%s%s %s' % (name, suffix, label(script=script, **labels), repr(float(value))))
+
+	ops = sorted(summary['operations'].items())
+	metric('itsm_soap_calls_total', 'counter', 'SOAP calls made, by operation and outcome.',
+	       [('', {'operation': op, 'outcome': outcome}, s[outcome]) for op, s in ops for outcome in OUTCOMES])
+	metric('itsm_soap_call_seconds', 'summary', 'Latency of SOAP calls, including retries, by operation.',
+	       [x for op, s in ops for x in (('', {'operation': op, 'quantile': '0.5'}, s['p50']), ('', {'operation': op, 'quantile': '0.95'}, s['p95']),
+	                                     ('_sum', {'operation': op}, s['seconds']), ('_count', {'operation': op}, s['calls']))])
+	metric('itsm_soap_request_bytes_total', 'counter', 'Bytes sent in SOAP requests, by operation.', [('', {'operation': op}, s['bytes_sent']) for op, s in ops])
+	metric('itsm_soap_response_bytes_total', 'counter', 'Bytes received in SOAP responses, before decompression, by operation.',
+	       [('', {'operation': op}, s['bytes_received']) for op, s in ops])
+	metric('itsm_soap_retries_total', 'counter', 'SOAP requests sent again after a dropped connection or lost authentication, by operation.',
+	       [('', {'operation': op}, s['retries']) for op, s in ops])
+	metric('itsm_run_seconds', 'gauge', 'Duration of the last run.', [('', {}, run['seconds'])])
+	metric('itsm_run_finished_timestamp_seconds', 'gauge', 'Time the last run finished.', [('', {}, run['finished'])])
+	metric('itsm_run_exit_code', 'gauge', 'Exit code of the last run, with 1 for an exception.', [('', {}, run['exit_code'])])
+
+	return '\n'.join(lines) + '\n'
+
+
+def write_metrics(directory, script, run, summary):
+	"""Writes ``summary`` and the ``run`` of ``script`` to ``script.json`` and, for the
+	node exporter's textfile collector, ``script.prom`` in ``directory``."""
+
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	data = dict(run, script=script, **summary)
+	write_atomic(os.path.join(directory, script + '.json'), json.dumps(data, indent=2, sort_keys=True))
+	write_atomic(os.path.join(directory, script + '.prom'), prometheus_text(script, run, summary).encode('utf-8'))
@@ -30,9 +30,13 @@ class OPCToADSM(ADSMBase):
 		cursor.execute("SELECT * FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = 'Server'")
 		server_columns = [row[3] for row in cursor]
 
+		def extract_principal(s):
+			result = re.search(r'[-0-9a-zA-Z.+_]+@[-0-9a-zA-Z.+_]+\.[a-zA-Z]{2,4}', s) if s else None
+			return result.group(0) if result else None
+
 		def extract_person_ref(s):
-			result = re.search(r'[-0-9a-zA-Z.+_]+@[-0-9a-zA-Z.+_]+\.[a-zA-Z]{2,4}', s)
-			return self.person_ref(result.group(0)) if result else None
+			principal = extract_principal(s)
+			return self.person_ref(principal) if principal else None
 
 		def extract_people_refs(ss):
 			return ADSMBase.ref_sep.join(filter(lambda x: x, map(extract_person_ref, ss)))
@@ -106,6 +110,9 @@ class OPCToADSM(ADSMBase):
 			for row in cursor:
 				yield dict(zip(server_columns, (str(row[0]),) + row[1:]))
 
+		def prefetch_f(rows):
+			self.resolve_people([extract_principal(r[x]) for r in rows for x in ('OwnerContact', 'BusinessOwner', 'SystemAdmin1', 'SystemAdmin2', 'SystemAdmin3')])
+
 		# Comparison function for creating and updating servers
 		def compare_f(ext_item, list_item):
 			if list_item == None:
@@ -116,12 +123,11 @@ class OPCToADSM(ADSMBase):
 					return 'Update'
 			return None
 
-		fields = ('ID', 'Title', '_ows_CIExternalReference1', '_ows_ExternalDateModified')
 		folder = '/sites/ADSM/Lists/CI/Assets'
 
 		# Sync
-		self.sync_to_list_by_comparison(self.ci_list_uuid, None, fields, '_ows_CIExternalReference1', physical_servers(), 'ServerId', compare_f, physical_servers_map, content_type=u'Asset—Server', folder=folder, commit=not self.args.d)
-		self.sync_to_list_by_comparison(self.ci_list_uuid, None, fields, '_ows_CIExternalReference1', virtual_machines(), 'ServerId', compare_f, virtual_machines_map, content_type=u'Alias—Virtual Machine', folder=folder, commit=not self.args.d)
+		self.sync_to_list_by_comparison(self.ci_list_uuid, None, None, '_ows_CIExternalReference1', physical_servers(), 'ServerId', compare_f, physical_servers_map, content_type=u'Asset—Server', folder=folder, commit=not self.args.d, prefetch_f=prefetch_f, compare_fields=('ExternalDateModified',))
+		self.sync_to_list_by_comparison(self.ci_list_uuid, None, None, '_ows_CIExternalReference1', virtual_machines(), 'ServerId', compare_f, virtual_machines_map, content_type=u'Alias—Virtual Machine', folder=folder, commit=not self.args.d, prefetch_f=prefetch_f, compare_fields=('ExternalDateModified',))
 
 
 def main(args=None):
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import collections
+import gc
+import os
+import resource
+import sys
+import time
+
+
+class RunProfiler(object):
+	"""Profiles the CPU time, memory, or both, of a run from ``start`` to ``stop``
+	and writes the reports to ``cpu_dir`` and ``memory_dir``. CPU time is profiled
+	with cProfile, which only sees the thread that started it, and saved as pstats
+	along with a text summary. Memory is traced with tracemalloc when it can be
+	imported; otherwise the objects tracked by the garbage collector are counted by
+	type at the start and end of the run, which misses strings, numbers and the
+	containers holding only those. Both survive the fork into a background
+	process, where the reports are written."""
+
+	top = 50
+
+	def __init__(self, name, cpu_dir=None, memory_dir=None):
+		self.name = name
+		self.cpu_dir = cpu_dir
+		self.memory_dir = memory_dir
+
+		self._profile = None
+		self._tracemalloc = None
+		self._census = None
+
+	def start(self):
+		if self.cpu_dir:
+			import cProfile
+			self._profile = cProfile.Profile()
+
+		if self.memory_dir:
+			try:
+				import tracemalloc
+				tracemalloc.start(25)
+				self._tracemalloc = tracemalloc
+			except ImportError:
+				self._census = self.census()
+
+		if self._profile:
+			self._profile.enable()
+
+	def stop(self):
+		"""Stops profiling and writes the reports, returning their paths."""
+
+		if self._profile:
+			self._profile.disable()
+
+		prefix = '%s-%s-%d' % (self.name, time.strftime('%Y%m%d-%H%M%S'), os.getpid())
+		paths = []
+		try:
+			if self._profile:
+				paths.extend(self._write_cpu(os.path.join(self.cpu_dir, prefix)))
+			if self.memory_dir:
+				paths.append(self._write_memory(os.path.join(self.memory_dir, prefix + '.memory.txt')))
+		except (IOError, OSError), e:
+			print 'Could not write profile: %s' % e
+		return paths
+
+	def _write_cpu(self, prefix):
+		import pstats
+
+		self._makedirs(self.cpu_dir)
+		self._profile.dump_stats(prefix + '.pstats')
+		with open(prefix + '.txt', 'w') as f:
+			stats = pstats.Stats(self._profile, stream=f)
+			stats.sort_stats('cumulative').print_stats(self.top)
+			stats.sort_stats('tottime').print_stats(self.top)
+		return [prefix + '.pstats', prefix + '.txt']
+
+	def _write_memory(self, path):
+		self._makedirs(self.memory_dir)
+		lines = ['Peak RSS: %.1f MB' % self.peak_rss()]
+
+		if self._tracemalloc:
+			current, peak = self._tracemalloc.get_traced_memory()
+			snapshot = self._tracemalloc.take_snapshot()
+			self._tracemalloc.stop()
+			lines.append('Traced: %.1f MB, peak %.1f MB' % (current / 1048576.0, peak / 1048576.0))
+			lines.append('')
+			lines.append('Top %d allocations by line:' % self.top)
+			lines.extend(str(s) for s in snapshot.statistics('lineno')[:self.top])
+			lines.append('')
+			lines.append('Top %d allocations by traceback:' % (self.top / 5))
+			for s in snapshot.statistics('traceback')[:self.top / 5]:
+				lines.append(str(s))
+				lines.extend('    ' + line for line in s.traceback.format())
+		else:
+			start, end = self._census, self.census()
+			growth = lambda t: end[t][1] - start.get(t, (0, 0))[1]
+			lines.append('tracemalloc is not available; objects tracked by the garbage collector, by type, largest growth first:')
+			lines.append('')
+			lines.append('%-40s %10s %10s %12s %12s' % ('type', 'objects', 'change', 'KB', 'change KB'))
+			for t in sorted(end, key=growth, reverse=True)[:self.top]:
+				count, size = end[t]
+				lines.append('%-40s %10d %+10d %12.1f %+12.1f' % (t[:40], count, count - start.get(t, (0, 0))[0], size / 1024.0, growth(t) / 1024.0))
+
+		with open(path, 'w') as f:
+			f.write('\n'.join(lines) + '\n')
+		return path
+
+	def census(self):
+		"""Returns the number and total size of the objects tracked by the garbage
+		collector, by type name."""
+
+		census = collections.defaultdict(lambda: [0, 0])
+		for o in gc.get_objects():
+			x = census[type(o).__name__]
+			x[0] += 1
+			x[1] += sys.getsizeof(o, 0)
+		return dict((t, tuple(x)) for t, x in census.items())
+
+	def peak_rss(self):
+		rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		return rss / (1048576.0 if sys.platform == 'darwin' else 1024.0)
+
+	def _makedirs(self, directory):
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
@@ -1,14 +1,13 @@
 #!/usr/bin/env python
 # coding=utf-8
 
+import collections
 import json
 import logging
 import sys
 
-from suds.sax.element import Attribute, Element
-from xlrd import open_workbook
-
 from itsm.adsm import ADSMBase
+from itsm.caml import BatchWriter, tag
 
 
 class PushToSP(ADSMBase):
@@ -30,6 +29,8 @@ class PushToSP(ADSMBase):
 		pass
 
 	def main(self):
+		from xlrd import open_workbook
+
 		# Get the Excel workbook and sheet.
 		# The sheet argument might have a slash with a sub-type name. Split as needed.
 		sheet_name, sub_type = self.args.sheet.split('/', 1) if '/' in self.args.sheet else (self.args.sheet, None)
@@ -58,7 +59,7 @@ class PushToSP(ADSMBase):
 			sp_source = sp_list_fieldnames
 
 		# Holds fields for the current operation
-		op_fields = Element('Fields')
+		op_fields = BatchWriter('Fields')
 
 		for row_idx in range(1, sheet.nrows):
 			row = sheet.row(row_idx)
@@ -82,15 +83,15 @@ class PushToSP(ADSMBase):
 			if sp_args.get('SPDefined', False):
 				continue
 
-			method = Element('Method').append(Attribute('ID', row_idx))
-			field = Element('Field')
+			field = collections.OrderedDict()
+			field_children = []
 
 			if self.args.op == 'delete':
 				# if sp_args.get('SPDelete', False) and c('Field Internal Name') in sp_source:
 				if c('Field Internal Name') in sp_source:
 					if self.args.type == 'columns' and sp_source[c('Field Internal Name')]._Group != self.args.spec:
 						continue
-					field.set('Name', c('Field Internal Name'))
+					field['Name'] = c('Field Internal Name')
 				else:
 					continue
 			else:
@@ -114,41 +115,35 @@ class PushToSP(ADSMBase):
 
 				for att, value in attrs:
 					if value:
-						field.set(att, value)
+						field[att] = value
 
 				if c('Type') in ('Choice', 'MultiChoice'):
-					choices = Element('CHOICES')
-					for c in c('Values').splitlines(False):
-						choices.append(Element('CHOICE').setText(c))
-					field.append(choices)
+					choices = [tag('CHOICE', text=choice) for choice in c('Values').splitlines(False)]
+					field_children.append(tag('CHOICES', children=choices))
 
 				if sp_args:
 					for k, v in sp_args.items():
 						if k == 'FieldRefs':
-							refs = Element(k)
-							for t in v:
-								refs.append(Element('FieldRef').append(Attribute('Name', t)))
-							field.append(refs)
+							field_children.append(tag(k, children=[tag('FieldRef', (('Name', t),)) for t in v]))
 						elif k in ('Default', 'Formula'):
-							field.append(Element(k).setText(v))
+							field_children.append(tag(k, text=v))
 						else:
-							field.set(k, v)
+							field[k] = v
 
-			method.append(field)
-			op_fields.append(method)
+			op_fields.append(row_idx, tag('Method', (('ID', row_idx),), children=[tag('Field', field.items(), children=field_children)]))
 
 		print '---Fields---'
-		print op_fields
+		print op_fields.xml().encode('utf-8')
 
-		if not op_fields.isempty() and not self.args.d:
+		if len(op_fields) > 0 and not self.args.d:
 			v = self.args.op + 'Fields'
 
 			if self.args.type == 'columns':
-				print self.adsm_webs.service.UpdateColumns(**{v:Element('ns1:%s' % v).append(op_fields)})
+				print self.adsm_webs.service.UpdateColumns(**{v:op_fields.element('ns1:%s' % v)})
 			elif self.args.type == 'content-type':
-				print self.adsm_webs.service.UpdateContentType(contentTypeId=self.args.spec, **{v:Element('ns1:%s' % v).append(op_fields)})
+				print self.adsm_webs.service.UpdateContentType(contentTypeId=self.args.spec, **{v:op_fields.element('ns1:%s' % v)})
 			elif self.args.type == 'list':
-				print self.adsm_lists.service.UpdateList(listName=self.args.spec, **{v:Element('ns1:%s' % v).append(op_fields)})
+				print self.adsm_lists.service.UpdateList(listName=self.args.spec, **{v:op_fields.element('ns1:%s' % v)})
 
 
 def main(args=None):
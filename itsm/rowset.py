@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import collections
+from cStringIO import StringIO
+from xml.etree.cElementTree import iterparse
+
+from suds.transport import Request, TransportError
+
+
+ROWSET_NS = 'urn:schemas-microsoft-com:rowset'
+ROW_NS = '#RowsetSchema'
+
+_keys = {}
+
+
+def _key(name):
+	# suds exposes the ows_ attributes of a row as _ows_ fields, and every row of a
+	# list has the same fields, so each key string is built and interned once.
+	key = _keys.get(name)
+	if key is None:
+		key = _keys.setdefault(name, intern('_' + str(name)))
+	return key
+
+
+class Row(dict):
+	"""A list item as a dict of its ``_ows_`` fields. Fields can also be read as
+	attributes, or through ``__dict__``, as they are on the objects suds returns."""
+
+	__slots__ = ()
+
+	def __getattr__(self, name):
+		try:
+			return self[name]
+		except KeyError:
+			raise AttributeError(name)
+
+	@property
+	def __dict__(self):
+		return self
+
+
+class Rowset(object):
+	"""Parses the ``rs:data`` element of a ``GetListItems`` response incrementally,
+	yielding a ``Row`` per ``z:row`` and discarding each element once it has been
+	read. ``item_count`` and ``position``, the paging position of the next page, are
+	read from the ``rs:data`` element when the rowset is created. A rowset can only
+	be iterated once."""
+
+	data_tag = '{%s}data' % ROWSET_NS
+	row_tag = '{%s}row' % ROW_NS
+
+	def __init__(self, source):
+		self._events = iterparse(StringIO(source) if isinstance(source, basestring) else source, events=('start', 'end'))
+		self._data = None
+		self.item_count = 0
+		self.position = None
+
+		for event, e in self._events:
+			if event == 'start' and e.tag == self.data_tag:
+				self._data = e
+				self.item_count = int(e.get('ItemCount', 0))
+				self.position = e.get('ListItemCollectionPositionNext')
+				break
+
+	def __iter__(self):
+		if self._data is None:
+			return
+
+		for event, e in self._events:
+			if event != 'end':
+				continue
+			if e.tag == self.row_tag:
+				yield Row((_key(k), unicode(v)) for k, v in e.items())
+				self._data.clear()
+			elif e is self._data:
+				break
+
+
+def send_raw(client, method, *args, **kwargs):
+	"""Invokes ``method`` on ``client``, which must have the ``nosend`` option set,
+	and returns the reply XML without letting suds parse or unmarshal it. Faults
+	are raised as they would be by suds."""
+
+	ctx = getattr(client.service, method)(*args, **kwargs)
+	request = Request(ctx.client.location(), ctx.envelope)
+	request.headers = ctx.client.headers()
+	try:
+		return client.options.transport.send(request).message
+	except TransportError, e:
+		ctx.process_reply(e.fp and e.fp.read() or '', e.httpcode, str(e))
+		raise
+
+
+class CompactRow(object):
+	"""A row of a ``RowStore``, read like a ``Row``, including through ``__dict__``.
+	Only the store's fields are kept, as a tuple, and fields the row did not have
+	raise ``KeyError``."""
+
+	__slots__ = ('_store', '_values')
+
+	def __init__(self, store, values):
+		self._store = store
+		self._values = values
+
+	def __getitem__(self, key):
+		i = self._store.index.get(key)
+		v = self._values[i] if i is not None and i < len(self._values) else None
+		if v is None:
+			raise KeyError(key)
+		return v
+
+	def __getattr__(self, name):
+		if name.startswith('__') or name in CompactRow.__slots__:
+			raise AttributeError(name)
+		try:
+			return self[name]
+		except KeyError:
+			raise AttributeError(name)
+
+	@property
+	def __dict__(self):
+		return self
+
+	# Without these, pickle and copy would take the __dict__ view for the state
+	def __getstate__(self):
+		return self._store, self._values
+
+	def __setstate__(self, state):
+		self._store, self._values = state
+
+	def get(self, key, default=None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def __contains__(self, key):
+		return self.get(key) is not None
+
+	def iteritems(self):
+		return ((k, v) for k, v in zip(self._store.fields, self._values) if v is not None)
+
+	def items(self):
+		return list(self.iteritems())
+
+	def keys(self):
+		return [k for k, v in self.iteritems()]
+
+	def values(self):
+		return [v for k, v in self.iteritems()]
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		return len(self.keys())
+
+	def __repr__(self):
+		return repr(dict(self.iteritems()))
+
+collections.Mapping.register(CompactRow)
+
+
+class RowStore(object):
+	"""Holds list rows compactly, for the tables that are kept in memory. Rows are
+	projected onto ``fields``, names of list fields with or without the ``_ows_``
+	prefix, and their values are converted to plain strings shared between rows. If
+	no fields are given, every field that any row has is kept."""
+
+	def __init__(self, fields=None):
+		self.fields = []
+		self.index = {}
+		self.dynamic = not fields
+		self._strings = {}
+
+		for f in fields or ():
+			self._field(f)
+
+	def _field(self, name):
+		name = field_key(name)
+		if name not in self.index:
+			self.index[name] = len(self.fields)
+			self.fields.append(name)
+
+	def _value(self, value):
+		if value is None:
+			return None
+		value = unicode(value)
+		return self._strings.setdefault(value, value)
+
+	def add(self, row):
+		"""Returns a ``CompactRow`` holding the store's fields of ``row``, a ``Row``,
+		dict or suds object."""
+
+		if isinstance(row, collections.Mapping):
+			get, keys = row.get, row.keys
+		else:
+			get, keys = row.__dict__.get, row.__keylist__.__iter__
+
+		if self.dynamic:
+			for k in keys():
+				self._field(k)
+
+		return CompactRow(self, tuple(self._value(get(f)) for f in self.fields))
+
+
+def field_key(name):
+	"""Returns the key of a list field in a row, given its internal name with or
+	without the ``_ows_`` prefix."""
+
+	return intern(str(name if name.startswith('_ows_') else '_ows_' + name))
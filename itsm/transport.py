@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import base64
+import collections
+import copy
+import httplib
+import re
+import socket
+import threading
+import time
+import urlparse
+import zlib
+from cStringIO import StringIO
+
+from suds.transport import Reply, Transport, TransportError
+
+from itsm.metrics import soap_operation
+
+
+# httplib reports a connection closed before the status line as an empty line,
+# or in later 2.7 releases with this message
+_unanswered_lines = ('', "''", 'No status line received - the server has closed the connection')
+
+
+class ConnectionPool(object):
+	"""Keeps up to ``maxsize`` idle persistent connections per host. A connection is
+	used by one request at a time, so any number of threads can share a pool."""
+
+	def __init__(self, maxsize=8, timeout=90):
+		self.maxsize = maxsize
+		self.timeout = timeout
+		self.created = 0
+
+		self._idle = {}
+		self._lock = threading.Lock()
+
+	def get(self, scheme, netloc):
+		with self._lock:
+			idle = self._idle.get((scheme, netloc))
+			if idle:
+				return idle.pop()
+			self.created += 1
+
+		conn = (httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection)(netloc, timeout=self.timeout)
+		conn.authenticated = False
+		conn.requests = 0
+		return conn
+
+	def put(self, scheme, netloc, conn):
+		with self._lock:
+			idle = self._idle.setdefault((scheme, netloc), [])
+			if len(idle) < self.maxsize:
+				idle.append(conn)
+				return
+		conn.close()
+
+	def close(self):
+		with self._lock:
+			idle, self._idle = self._idle, {}
+		for conns in idle.values():
+			for conn in conns:
+				conn.close()
+
+
+class PooledTransport(Transport):
+	"""A suds transport that sends requests over persistent connections from a
+	``ConnectionPool``. With a ``DOMAIN\\user`` username, each connection is
+	authenticated with NTLM once, when it is first used, and reused for as long
+	as the server keeps it open. Other usernames are sent with basic auth. suds
+	links a transport's options to those of its client, so each client needs its
+	own transport; ``share`` returns one that uses the same pool and stats, and
+	clones of a client are given one.
+
+	With ``compress`` set, gzip or deflate encoded responses are requested and
+	decompressed as they are read. ``stats`` counts requests and the bytes sent,
+	received and, after decompression, decoded. Each SOAP call is also recorded,
+	with its latency, bytes, retries and outcome, in ``metrics`` if one is given."""
+
+	def __init__(self, username=None, password=None, maxsize=8, timeout=90, compress=True, metrics=None):
+		Transport.__init__(self)
+		self.options.username = username
+		self.options.password = password
+		self.options.timeout = timeout
+		self.pool = ConnectionPool(maxsize=maxsize, timeout=timeout)
+		self.ntlm = bool(username and '\\' in username)
+		self.compress = compress
+		self.stats = collections.Counter()
+		self.metrics = metrics
+
+		self._stats_lock = threading.Lock()
+
+	def __deepcopy__(self, memo):
+		# suds deep copies the options of clients it clones, transport included
+		return self.share()
+
+	def share(self):
+		"""Returns a transport for another client that sends requests through this
+		transport's pool and counts them in its stats."""
+
+		transport = copy.copy(self)
+		Transport.__init__(transport)
+		transport.options.username = self.options.username
+		transport.options.password = self.options.password
+		transport.options.timeout = self.options.timeout
+		transport.options.headers = dict(self.options.headers)
+		return transport
+
+	def open(self, request):
+		if not request.url.startswith(('http:', 'https:')):
+			import urllib2
+			return urllib2.urlopen(request.url)
+		return StringIO(self._request('GET', request).message)
+
+	def send(self, request):
+		counts = collections.Counter()
+		outcome = 'error'
+		start = time.time()
+		try:
+			reply = self._request('POST', request, counts)
+			outcome = 'ok'
+			return reply
+		except TransportError, e:
+			if e.httpcode == httplib.INTERNAL_SERVER_ERROR:
+				outcome = 'fault'
+			raise
+		finally:
+			if self.metrics is not None:
+				self.metrics.record(soap_operation(request.headers), time.time() - start, counts['bytes_sent'], counts['bytes_received'],
+				                    counts['retries'], outcome)
+
+	def _request(self, method, request, counts=None):
+		# httplib joins the request line and headers to the body, so all must be bytes
+		url = urlparse.urlsplit(request.url.encode('utf-8') if isinstance(request.url, unicode) else request.url)
+		path = url.path + ('?' + url.query if url.query else '')
+		headers = dict((str(k), str(v)) for k, v in dict(self.options.headers, **request.headers).items())
+		if self.options.username and not self.ntlm:
+			headers['Authorization'] = 'Basic ' + base64.b64encode('%s:%s' % (self.options.username, self.options.password))
+		if self.compress:
+			headers.setdefault('Accept-Encoding', 'gzip, deflate')
+		counts = collections.Counter() if counts is None else counts
+
+		while True:
+			conn = self.pool.get(url.scheme, url.netloc)
+			reused = conn.requests > 0
+			try:
+				response, body = self._exchange(conn, method, path, request.message, headers, counts)
+				break
+			except (httplib.HTTPException, socket.error), e:
+				conn.close()
+				# The server may have closed an idle connection, so retry those once on a
+				# new connection, but only if the request cannot have been processed: it
+				# failed to send, or the connection closed without any response. Timeouts
+				# and errors reading a response are not retried, as the request may have
+				# been applied. Requests on new connections fail as usual.
+				if not reused or isinstance(e, socket.timeout) or (conn.sent and not self._unanswered(e)):
+					raise
+				counts['retries'] += 1
+
+		if response.will_close:
+			conn.close()
+		else:
+			self.pool.put(url.scheme, url.netloc, conn)
+
+		if response.status in (httplib.ACCEPTED, httplib.NO_CONTENT):
+			return None
+		if response.status >= 300:
+			raise TransportError(response.reason, response.status, StringIO(body))
+		return Reply(response.status, dict(response.getheaders()), body)
+
+	def _unanswered(self, error):
+		return isinstance(error, httplib.BadStatusLine) and error.line in _unanswered_lines
+
+	def _roundtrip(self, conn, method, path, body, headers, counts):
+		conn.sent = False
+		conn.request(method, path, body, headers)
+		conn.sent = True
+		conn.requests += 1
+		counts['bytes_sent'] += len(body or '')
+		response = conn.getresponse()
+		received, data = self._read(response)
+		counts['bytes_received'] += received
+
+		with self._stats_lock:
+			self.stats['requests'] += 1
+			self.stats['bytes_sent'] += len(body or '')
+			self.stats['bytes_received'] += received
+			self.stats['bytes_decoded'] += len(data)
+			if received != len(data):
+				self.stats['compressed_responses'] += 1
+
+		return response, data
+
+	def _read(self, response):
+		"""Reads a response, decompressing it chunk by chunk if it is encoded, and
+		returns the number of bytes received and the decoded body."""
+
+		encoding = (response.getheader('content-encoding') or '').strip().lower()
+		if encoding in ('gzip', 'x-gzip'):
+			decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+		elif encoding == 'deflate':
+			decoder = zlib.decompressobj()
+		else:
+			decoder = None
+
+		chunks = []
+		received = 0
+		while True:
+			chunk = response.read(65536)
+			if not chunk:
+				break
+			if decoder and not received and encoding == 'deflate':
+				# Some servers send raw deflate data without the zlib header
+				try:
+					zlib.decompressobj().decompress(chunk[:2])
+				except zlib.error:
+					decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+			received += len(chunk)
+			chunks.append(decoder.decompress(chunk) if decoder else chunk)
+		if decoder:
+			chunks.append(decoder.flush())
+
+		return received, ''.join(chunks)
+
+	def _exchange(self, conn, method, path, body, headers, counts):
+		if self.ntlm and not conn.authenticated:
+			return self._ntlm_handshake(conn, method, path, body, headers, counts)
+
+		response, data = self._roundtrip(conn, method, path, body, headers, counts)
+		if response.status == httplib.UNAUTHORIZED and self.ntlm and not response.will_close:
+			# The server forgot the connection's authentication
+			conn.authenticated = False
+			counts['retries'] += 1
+			return self._ntlm_handshake(conn, method, path, body, headers, counts)
+		return response, data
+
+	def _ntlm_handshake(self, conn, method, path, body, headers, counts):
+		from ntlm import ntlm
+
+		domain, user = self.options.username.split('\\', 1)
+		headers = dict(headers, Connection='Keep-Alive')
+
+		negotiate = ntlm.create_NTLM_NEGOTIATE_MESSAGE(self.options.username)
+		response, data = self._roundtrip(conn, method, path, body, dict(headers, Authorization='NTLM ' + negotiate), counts)
+		challenge = re.search(r'NTLM ([A-Za-z0-9+\-/=]+)', response.getheader('www-authenticate', ''))
+		if response.status != httplib.UNAUTHORIZED or not challenge:
+			conn.authenticated = response.status != httplib.UNAUTHORIZED
+			return response, data
+
+		if response.getheader('set-cookie'):
+			headers['Cookie'] = response.getheader('set-cookie')
+		server_challenge, flags = ntlm.parse_NTLM_CHALLENGE_MESSAGE(challenge.group(1))
+		authenticate = ntlm.create_NTLM_AUTHENTICATE_MESSAGE(server_challenge, user, domain.upper(), self.options.password, flags)
+		response, data = self._roundtrip(conn, method, path, body, dict(headers, Authorization='NTLM ' + authenticate), counts)
+		conn.authenticated = response.status != httplib.UNAUTHORIZED
+		return response, data
@@ -60,12 +60,15 @@ class UnitsToADSM(ADSMBase):
 				return 'Update'
 			return None
 
+		def prefetch_f(units):
+			self.resolve_people([x['Email'] for r in units for x in r['Coordinators']['Coordinator']])
+
 		# Comparison function for linking units to their parents and children
 		def parents_children_compare_f(ext_item, list_item):
 			return 'Update' if ext_item['Id'] in updated_unit_ids else None
 
 		# Sync
-		self.sync_to_list_by_comparison(UnitsToADSM.uc_list, None, UnitsToADSM.unit_fields, '_ows_CIExternalReference1', public_units, 'Id', create_update_compare_f, create_update_field_map, commit=not self.args.d, content_type='Unit')
+		self.sync_to_list_by_comparison(UnitsToADSM.uc_list, None, None, '_ows_CIExternalReference1', public_units, 'Id', create_update_compare_f, create_update_field_map, commit=not self.args.d, content_type='Unit', prefetch_f=prefetch_f, ledger=True, compare_fields=('CIExternalReference2',))
 		# self.reset_caches()
 		# self.sync_to_list_by_comparison(UnitsToADSM.uc_list, None, UnitsToADSM.unit_fields, '_ows_CIExternalReference1', public_units, 'Id', parents_children_compare_f, parents_children_field_map, commit=not self.args.d)
 
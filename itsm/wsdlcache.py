@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import cPickle as pickle
+import glob
+import hashlib
+import os
+import tempfile
+import time
+
+import suds
+from suds.cache import Cache
+
+
+class WSDLCache(Cache):
+	"""A suds object cache that keeps pickled WSDL definitions in ``location`` for
+	``duration`` seconds. Used with ``cachingpolicy=1``, clients are created from the
+	parsed definitions, with their imported schemas, without downloading or parsing
+	any documents. Entries are written to a temporary file and renamed into place,
+	so several processes can share the directory, and each entry starts with a hash
+	of its content, so a damaged entry is treated as missing."""
+
+	suffix = '.wsdl'
+
+	def __init__(self, location, duration=86400):
+		self.location = location
+		self.duration = duration
+
+		if not os.path.isdir(location):
+			try:
+				os.makedirs(location)
+			except OSError:
+				# Another process may have created it first
+				if not os.path.isdir(location):
+					raise
+
+	def _path(self, id):
+		# Pickles are only compatible with the suds version that made them
+		key = hashlib.sha1('%s %s' % (suds.__version__, id)).hexdigest()
+		return os.path.join(self.location, key + self.suffix)
+
+	def get(self, id):
+		path = self._path(id)
+		try:
+			if time.time() - os.path.getmtime(path) > self.duration:
+				return None
+			with open(path, 'rb') as f:
+				digest = f.readline().strip()
+				data = f.read()
+		except (IOError, OSError):
+			return None
+
+		if hashlib.sha1(data).hexdigest() != digest:
+			return None
+		try:
+			return pickle.loads(data)
+		except Exception:
+			return None
+
+	def put(self, id, object):
+		try:
+			data = pickle.dumps(object, pickle.HIGHEST_PROTOCOL)
+			fd, tmp = tempfile.mkstemp(dir=self.location, prefix='.tmp-')
+		except Exception:
+			# Caching is an optimization, so a definition that can't be stored is
+			# simply fetched again next time
+			return object
+
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				f.write(hashlib.sha1(data).hexdigest() + '\n')
+				f.write(data)
+			os.rename(tmp, self._path(id))
+		except (IOError, OSError):
+			try:
+				os.remove(tmp)
+			except OSError:
+				pass
+
+		return object
+
+	def purge(self, id):
+		try:
+			os.remove(self._path(id))
+		except OSError:
+			pass
+
+	def clear(self):
+		for path in glob.glob(os.path.join(self.location, '*' + self.suffix)):
+			try:
+				os.remove(path)
+			except OSError:
+				pass